@@ -1,40 +1,245 @@
+import os
+import json
 import time
+import asyncio
+import base64
+import hashlib
 import logging
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 from typing import Optional
 from datetime import datetime, timedelta
 
-from fastapi import FastAPI, HTTPException
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import Response
 from pydantic import BaseModel, Field
-from prometheus_client import generate_latest, Counter, Histogram
+from prometheus_client import generate_latest, Counter, Gauge, Histogram
 import uvicorn
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient
 from pymongo.errors import ConnectionFailure
+from pymongo.monitoring import ConnectionPoolListener
 
 logger = logging.getLogger("uvicorn")
 
 # MongoDB connection
-MONGODB_URI = "mongodb://mongo:27017"
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://mongo:27017")
 DB_NAME = "redditPosts"
 COLLECTION_NAME = "posts"
+# Per subreddit and time bucket counts maintained by the consumer
+ROLLUP_COLLECTION_NAME = "post_rollups"
+
+# Sentiment label codes written by the consumer (title_label, selftext_label, sentiment_label)
+POSITIVE, NEGATIVE, NEUTRAL = 1, -1, 0
 
 # Metrics
 DATA_REQUESTS = Counter("data_requests_total", "Total number of data requests")
 DATA_ERRORS = Counter("data_errors_total", "Total number of failed data requests")
 DATA_LATENCY = Histogram("data_latency_seconds", "Data retrieval latency in seconds")
 
+# Connection pool metrics
+POOL_CHECKED_OUT = Gauge("mongo_pool_checked_out_connections", "Connections currently checked out of the pool")
+POOL_OPEN = Gauge("mongo_pool_open_connections", "Open connections in the pool")
+POOL_WAIT = Histogram("mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection",
+                      buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+POOL_CHECKOUT_FAILURES = Counter("mongo_pool_checkout_failures_total", "Failed connection checkouts", ["reason"])
+
+# Response cache metrics
+CACHE_REQUESTS = Counter("response_cache_requests_total", "Cached endpoint requests by result (hit, miss, coalesced)",
+                         ["endpoint", "result"])
+CACHE_NOT_MODIFIED = Counter("response_not_modified_total", "Requests answered with 304 Not Modified", ["endpoint"])
+
+class PoolMetrics(ConnectionPoolListener):
+    """Feeds pool events from the driver into the Prometheus metrics above."""
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_created(self, event):
+        POOL_OPEN.inc()
+
+    def connection_closed(self, event):
+        POOL_OPEN.dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        POOL_CHECKOUT_FAILURES.labels(str(event.reason)).inc()
+
+    def connection_checked_out(self, event):
+        POOL_CHECKED_OUT.inc()
+        if getattr(event, "duration", None) is not None:
+            POOL_WAIT.observe(event.duration)
+
+    def connection_checked_in(self, event):
+        POOL_CHECKED_OUT.dec()
+
+# Pool settings, sized for concurrent dashboard polling
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "5")),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "15000")),
+    # Dashboard reads tolerate slightly stale data, so secondaries can serve them
+    "readPreference": os.getenv("MONGO_READ_PREFERENCE", "secondaryPreferred"),
+}
+
 # MongoDB client
-mongo_client: Optional[MongoClient] = None
+mongo_client: Optional[AsyncMongoClient] = None
+
+# Indexes for the endpoint query patterns: every query filters on a now_time range
+INDEXES = {
+    COLLECTION_NAME: [
+        # /recent-data keyset pagination order
+        ([("now_time", DESCENDING), ("_id", DESCENDING)], "now_time_id_desc"),
+        ([("subreddit", ASCENDING), ("now_time", DESCENDING)], "subreddit_now_time"),
+        # Covers the /recent-data window counts: no document fetches needed
+        ([("now_time", DESCENDING), ("subreddit", ASCENDING), ("title_label", ASCENDING), ("selftext_label", ASCENDING)],
+         "now_time_summary_covering"),
+    ],
+    # The consumer creates the unique (subreddit, bucket) index it upserts on
+    ROLLUP_COLLECTION_NAME: [
+        ([("bucket", DESCENDING), ("subreddit", ASCENDING)], "bucket_subreddit"),
+    ],
+}
+
+async def ensure_indexes(db) -> None:
+    """Create the endpoint indexes; already existing ones are left as they are."""
+    for collection_name, indexes in INDEXES.items():
+        for keys, name in indexes:
+            await db[collection_name].create_index(keys, name=name)
+        logger.info(f"Ensured {len(indexes)} indexes on {DB_NAME}.{collection_name}")
+
+def time_range_query(hours: int, end_time: datetime, field: str = "now_time") -> dict:
+    start_time_range = end_time - timedelta(hours=hours)
+    return {
+        field: {
+            "$gte": start_time_range.timestamp(),
+            "$lte": end_time.timestamp()
+        }
+    }
+
+def sentiment_summary_pipeline(query: dict) -> list[dict]:
+    """Runs on the rollup collection."""
+    return [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": None,
+                "total_posts": {"$sum": "$posts"},
+                "total_subreddits": {"$addToSet": "$subreddit"}
+            }
+        }
+    ]
+
+async def aggregate_list(collection, pipeline: list[dict]) -> list[dict]:
+    cursor = await collection.aggregate(pipeline)
+    return await cursor.to_list()
+
+LABEL_NAMES = (("positive", POSITIVE), ("negative", NEGATIVE), ("neutral", NEUTRAL))
+
+def label_counts(*fields: str) -> dict:
+    """$group accumulators counting each label code over the given fields."""
+    return {
+        f"{name}_count": {"$sum": {"$add": [
+            {"$cond": [{"$eq": [f"${field}", code]}, 1, 0]} for field in fields
+        ]}}
+        for name, code in LABEL_NAMES
+    }
+
+def window_counts_pipeline(query: dict) -> list[dict]:
+    """Total posts and title sentiment counts over the whole window, in one pass."""
+    return [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": None,
+                "total_count": {"$sum": 1},
+                **label_counts("title_label")
+            }
+        }
+    ]
+
+def rollup_label_sums(*fields: str) -> dict:
+    """$group accumulators adding up the rollup label counters of the given fields."""
+    return {
+        f"{name}_count": {"$sum": {"$add": [{"$ifNull": [f"${field}_{name}", 0]} for field in fields]}}
+        for name, _ in LABEL_NAMES
+    }
+
+def rollup_window_counts_pipeline(query: dict) -> list[dict]:
+    """Same output as window_counts_pipeline, estimated from the rollup collection."""
+    return [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": None,
+                "total_count": {"$sum": "$posts"},
+                **rollup_label_sums("title")
+            }
+        }
+    ]
+
+def subreddit_stats_pipeline(query: dict) -> list[dict]:
+    """Runs on the rollup collection."""
+    return [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": "$subreddit",
+                "post_count": {"$sum": "$posts"},
+                **rollup_label_sums("title", "selftext")
+            }
+        },
+        {
+            "$sort": {"post_count": -1}
+        }
+    ]
+
+def sentiment_timeline_pipeline(query: dict, bucket_seconds: int) -> list[dict]:
+    """Runs on the rollup collection; merges rollup buckets into `bucket_seconds` steps."""
+    return [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": {"$subtract": ["$bucket", {"$mod": ["$bucket", bucket_seconds]}]},
+                "post_count": {"$sum": "$posts"},
+                **rollup_label_sums("title", "selftext"),
+                **{
+                    f"{name}_score_sum": {"$sum": {"$ifNull": [f"${name}_score_sum", 0]}}
+                    for name, _ in LABEL_NAMES
+                }
+            }
+        },
+        {
+            "$sort": {"_id": 1}
+        }
+    ]
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global mongo_client
     try:
-        mongo_client = MongoClient(MONGODB_URI)
+        mongo_client = AsyncMongoClient(MONGODB_URI, event_listeners=[PoolMetrics()], **MONGO_CLIENT_OPTIONS)
         # Test connection
-        mongo_client.admin.command('ping')
+        await mongo_client.admin.command('ping')
         logger.info("Successfully connected to MongoDB")
+        await ensure_indexes(mongo_client[DB_NAME])
     except ConnectionFailure as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
         mongo_client = None
@@ -42,7 +247,7 @@ async def lifespan(app: FastAPI):
     yield
     
     if mongo_client:
-        mongo_client.close()
+        await mongo_client.close()
         logger.info("MongoDB connection closed")
 
 app = FastAPI(
@@ -51,27 +256,134 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Response cache: every dashboard session polls the same few queries
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "5"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+CACHED_PATHS = {"/recent-data", "/sentiment-summary", "/subreddit-stats", "/sentiment-timeline"}
+
+class CachedResponse:
+    def __init__(self, status_code: int, body: bytes, media_type: str):
+        self.status_code = status_code
+        self.body = body
+        self.media_type = media_type
+        self.expires_at = time.monotonic() + RESPONSE_CACHE_TTL
+        # last_updated changes on every query, so it is left out of the ETag
+        payload = json.loads(body) if status_code == 200 else None
+        if isinstance(payload, dict):
+            payload.pop("last_updated", None)
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+        self.etag = f'"{hashlib.sha1(canonical).hexdigest()[:20]}"'
+
+class ResponseCache:
+    """
+    TTL cache of rendered responses keyed by path and query string. Concurrent
+    misses for the same key share one in-flight computation (single-flight).
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self.in_flight: dict[tuple, asyncio.Future] = {}
+
+    async def get(self, key: tuple, compute) -> tuple[CachedResponse, str]:
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            return entry, "hit"
+        leader = self.in_flight.get(key)
+        if leader is not None:
+            try:
+                return await asyncio.shield(leader), "coalesced"
+            except BaseException:
+                if not leader.done():
+                    raise  # this request itself was cancelled
+                # the leading request failed; compute our own below
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            entry = await compute()
+            future.set_result(entry)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark as retrieved when nobody was waiting
+            raise
+        finally:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+        if entry.status_code == 200:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry, "miss"
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES)
+
+@app.middleware("http")
+async def cache_responses(request: Request, call_next):
+    path = request.url.path
+    if request.method != "GET" or path not in CACHED_PATHS or RESPONSE_CACHE_TTL <= 0:
+        return await call_next(request)
+
+    async def render() -> CachedResponse:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        return CachedResponse(response.status_code, body, response.media_type or "application/json")
+
+    key = (path, tuple(sorted(request.query_params.multi_items())))
+    entry, result = await response_cache.get(key, render)
+    CACHE_REQUESTS.labels(path, result).inc()
+
+    if entry.status_code != 200:
+        return Response(entry.body, status_code=entry.status_code, media_type=entry.media_type)
+    headers = {"ETag": entry.etag, "Cache-Control": f"max-age={int(RESPONSE_CACHE_TTL)}"}
+    if entry.etag in request.headers.get("if-none-match", ""):
+        CACHE_NOT_MODIFIED.labels(path).inc()
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type=entry.media_type, headers=headers)
+
 # Pydantic models
-class SentimentData(BaseModel):
-    label: str
-    score: float
-
-class RedditPost(BaseModel):
-    id: str = Field(alias="_id")
-    title: str
-    selftext: str
-    url: str
-    created_utc: float
-    now_time: float
-    subreddit: str
-    title_sentiment: list[SentimentData]
-    selftext_sentiment: list[SentimentData]
+# Post fields /recent-data returns by default; `fields=` picks a subset
+POST_FIELDS = ["_id", "title", "selftext", "url", "created_utc", "now_time", "subreddit",
+               "title_sentiment", "selftext_sentiment", "sentiment_label", "sentiment_score"]
+MAX_PAGE_SIZE = 1000
 
 class DashboardData(BaseModel):
-    posts: list[RedditPost]
-    total_count: int
+    # post documents, restricted to the requested POST_FIELDS
+    posts: list[dict]
+    total_count: Optional[int] = None
+    total_count_estimated: bool = False
+    next_cursor: Optional[str] = None
     last_updated: datetime
-    sentiment_summary: dict
+    sentiment_summary: Optional[dict] = None
+
+def encode_cursor(post_doc: dict) -> str:
+    raw = json.dumps({"t": post_doc["now_time"], "id": str(post_doc["_id"])}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    """Query for the posts after `cursor` in (now_time, _id) descending order."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        now_time, post_id = float(raw["t"]), raw["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    post_id = ObjectId(post_id) if ObjectId.is_valid(post_id) else post_id
+    return {"$or": [
+        {"now_time": {"$lt": now_time}},
+        {"now_time": now_time, "_id": {"$lt": post_id}}
+    ]}
+
+def parse_fields(fields: Optional[str]) -> dict:
+    if not fields:
+        return {name: 1 for name in POST_FIELDS}
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = set(requested) - set(POST_FIELDS) - {"id"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    # now_time and _id are always needed for the next cursor
+    return {name: 1 for name in ["_id", "now_time", *requested]}
 
 class TimeRangeQuery(BaseModel):
     hours: int = Field(default=24, ge=1, le=168, description="Hours to look back (1-168)")
@@ -84,61 +396,64 @@ async def health_check():
     return {"status": "healthy", "mongodb": "connected"}
 
 @app.get("/recent-data", response_model=DashboardData)
-async def get_recent_data(hours: int = 24):
-    """Get recent sentiment data for the dashboard"""
+async def get_recent_data(
+    hours: int = 24,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE, description="Posts per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated post fields to return"),
+    total: str = Query("exact", pattern="^(exact|estimate|none)$",
+                       description="total_count and sentiment_summary: exact, estimate (from rollups) or none")
+):
+    """Get recent sentiment data for the dashboard, newest first, one page at a time"""
     start_time = time.time()
     DATA_REQUESTS.inc()
+    projection = parse_fields(fields)
+    after = decode_cursor(cursor) if cursor else None
     
     try:
         if mongo_client is None:
             raise HTTPException(status_code=503, detail="MongoDB not connected")
         
-        # Calculate time range
-        end_time = datetime.utcnow()
-        start_time_range = end_time - timedelta(hours=hours)
-        
         # Query MongoDB for recent posts
         collection = mongo_client[DB_NAME][COLLECTION_NAME]
         
         # Get posts from the last N hours
-        query = {
-            "now_time": {
-                "$gte": start_time_range.timestamp(),
-                "$lte": end_time.timestamp()
-            }
-        }
+        end_time = datetime.utcnow()
+        query = time_range_query(hours, end_time)
         
-        # Sort by most recent first
-        posts_cursor = collection.find(query).sort("now_time", -1).limit(100)
+        page_query = {"$and": [query, after]} if after else query
         
-        posts = []
-        sentiment_counts = {"positive": 0, "negative": 0, "neutral": 0}
+        # Window totals: exact over the posts, estimated from rollups, or skipped
+        if total == "exact":
+            counts_query = aggregate_list(collection, window_counts_pipeline(query))
+        elif total == "estimate":
+            counts_query = aggregate_list(mongo_client[DB_NAME][ROLLUP_COLLECTION_NAME],
+                                          rollup_window_counts_pipeline(time_range_query(hours, end_time, "bucket")))
+        else:
+            counts_query = asyncio.sleep(0, result=None)
         
-        for post_doc in posts_cursor:
+        # Sort by most recent first, one extra post to know whether there is a next page
+        post_docs, counts = await asyncio.gather(
+            collection.find(page_query, projection).sort([("now_time", -1), ("_id", -1)]).limit(limit + 1).to_list(),
+            counts_query
+        )
+        next_cursor = encode_cursor(post_docs[limit - 1]) if len(post_docs) > limit else None
+        post_docs = post_docs[:limit]
+        
+        for post_doc in post_docs:
             # Convert MongoDB ObjectId to string
             post_doc["_id"] = str(post_doc["_id"])
-            
-            # Count sentiments
-            if post_doc.get("title_sentiment"):
-                for sentiment in post_doc["title_sentiment"]:
-                    if sentiment.get("label") == "POSITIVE":
-                        sentiment_counts["positive"] += 1
-                    elif sentiment.get("label") == "NEGATIVE":
-                        sentiment_counts["negative"] += 1
-                    else:
-                        sentiment_counts["neutral"] += 1
-            
-            posts.append(RedditPost(**post_doc))
-        
-        # Get total count for the time range
-        total_count = collection.count_documents(query)
         
         dashboard_data = DashboardData(
-            posts=posts,
-            total_count=total_count,
-            last_updated=end_time,
-            sentiment_summary=sentiment_counts
+            posts=post_docs,
+            next_cursor=next_cursor,
+            last_updated=end_time
         )
+        if counts is not None:
+            counts = counts[0] if counts else {}
+            dashboard_data.total_count = counts.get("total_count", 0)
+            dashboard_data.total_count_estimated = total == "estimate"
+            dashboard_data.sentiment_summary = {name: counts.get(f"{name}_count", 0) for name, _ in LABEL_NAMES}
         
         return dashboard_data
         
@@ -158,32 +473,11 @@ async def get_sentiment_summary(hours: int = 24):
         if mongo_client is None:
             raise HTTPException(status_code=503, detail="MongoDB not connected")
         
-        collection = mongo_client[DB_NAME][COLLECTION_NAME]
+        rollups = mongo_client[DB_NAME][ROLLUP_COLLECTION_NAME]
         
-        # Calculate time range
+        # Aggregate sentiment data from the time-bucket rollups
         end_time = datetime.utcnow()
-        start_time_range = end_time - timedelta(hours=hours)
-        
-        # Aggregate sentiment data
-        pipeline = [
-            {
-                "$match": {
-                    "now_time": {
-                        "$gte": start_time_range.timestamp(),
-                        "$lte": end_time.timestamp()
-                    }
-                }
-            },
-            {
-                "$group": {
-                    "_id": None,
-                    "total_posts": {"$sum": 1},
-                    "total_subreddits": {"$addToSet": "$subreddit"}
-                }
-            }
-        ]
-        
-        result = list(collection.aggregate(pipeline))
+        result = await aggregate_list(rollups, sentiment_summary_pipeline(time_range_query(hours, end_time, "bucket")))
         
         if result:
             summary = result[0]
@@ -212,74 +506,21 @@ async def get_subreddit_stats(hours: int = 24):
         if mongo_client is None:
             raise HTTPException(status_code=503, detail="MongoDB not connected")
         
-        collection = mongo_client[DB_NAME][COLLECTION_NAME]
+        rollups = mongo_client[DB_NAME][ROLLUP_COLLECTION_NAME]
         
-        # Calculate time range
+        # Aggregate the time-bucket rollups by subreddit
         end_time = datetime.utcnow()
-        start_time_range = end_time - timedelta(hours=hours)
-        
-        # Aggregate by subreddit
-        pipeline = [
-            {
-                "$match": {
-                    "now_time": {
-                        "$gte": start_time_range.timestamp(),
-                        "$lte": end_time.timestamp()
-                    }
-                }
-            },
-            {
-                "$group": {
-                    "_id": "$subreddit",
-                    "post_count": {"$sum": 1},
-                    "sentiment_breakdown": {
-                        "$push": {
-                            "title_sentiment": "$title_sentiment",
-                            "selftext_sentiment": "$selftext_sentiment"
-                        }
-                    }
-                }
-            },
-            {
-                "$sort": {"post_count": -1}
-            }
-        ]
-        
-        results = list(collection.aggregate(pipeline))
+        results = await aggregate_list(rollups, subreddit_stats_pipeline(time_range_query(hours, end_time, "bucket")))
         
         subreddit_stats = []
         for result in results:
-            # Calculate sentiment distribution for this subreddit
-            positive_count = 0
-            negative_count = 0
-            neutral_count = 0
-            
-            for sentiment_data in result["sentiment_breakdown"]:
-                if sentiment_data.get("title_sentiment"):
-                    for sentiment in sentiment_data["title_sentiment"]:
-                        if sentiment.get("label") == "POSITIVE":
-                            positive_count += 1
-                        elif sentiment.get("label") == "NEGATIVE":
-                            negative_count += 1
-                        else:
-                            neutral_count += 1
-                
-                if sentiment_data.get("selftext_sentiment"):
-                    for sentiment in sentiment_data["selftext_sentiment"]:
-                        if sentiment.get("label") == "POSITIVE":
-                            positive_count += 1
-                        elif sentiment.get("label") == "NEGATIVE":
-                            negative_count += 1
-                        else:
-                            neutral_count += 1
-            
             subreddit_stats.append({
                 "subreddit": result["_id"],
                 "post_count": result["post_count"],
                 "sentiment_distribution": {
-                    "positive": positive_count,
-                    "negative": negative_count,
-                    "neutral": neutral_count
+                    "positive": result["positive_count"],
+                    "negative": result["negative_count"],
+                    "neutral": result["neutral_count"]
                 }
             })
         
@@ -293,6 +534,90 @@ async def get_subreddit_stats(hours: int = 24):
         logger.error(f"Error fetching subreddit stats: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.get("/sentiment-timeline")
+async def get_sentiment_timeline(hours: int = 24, bucket_minutes: int = 5):
+    """Get post and sentiment counts per time bucket"""
+    try:
+        if mongo_client is None:
+            raise HTTPException(status_code=503, detail="MongoDB not connected")
+        
+        rollups = mongo_client[DB_NAME][ROLLUP_COLLECTION_NAME]
+        
+        end_time = datetime.utcnow()
+        pipeline = sentiment_timeline_pipeline(time_range_query(hours, end_time, "bucket"), max(1, bucket_minutes) * 60)
+        results = await aggregate_list(rollups, pipeline)
+        
+        buckets = []
+        for result in results:
+            buckets.append({
+                "bucket_start": datetime.utcfromtimestamp(result["_id"]).isoformat(),
+                "post_count": result["post_count"],
+                "sentiment_distribution": {name: result[f"{name}_count"] for name, _ in LABEL_NAMES},
+                "score_sums": {name: result[f"{name}_score_sum"] for name, _ in LABEL_NAMES}
+            })
+        
+        return {
+            "time_range_hours": hours,
+            "bucket_minutes": bucket_minutes,
+            "buckets": buckets,
+            "last_updated": end_time.isoformat()
+        }
+        
+    except Exception as e:
+        logger.error(f"Error fetching sentiment timeline: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+def _plan_stages(plan, winning: bool = False) -> set[str]:
+    """Stage names of the winning plan(s) in an explain() output; rejected plans are ignored."""
+    stages = set()
+    if isinstance(plan, dict):
+        if winning and "stage" in plan:
+            stages.add(plan["stage"])
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                stages |= _plan_stages(value, winning or key == "winningPlan")
+    elif isinstance(plan, list):
+        for item in plan:
+            stages |= _plan_stages(item, winning)
+    return stages
+
+async def explain_queries(hours: int = 24) -> dict:
+    """Run explain() on every endpoint query and report the plan stages used."""
+    db = mongo_client[DB_NAME]
+    collection = db[COLLECTION_NAME]
+    end_time = datetime.utcnow()
+    query = time_range_query(hours, end_time)
+    bucket_query = time_range_query(hours, end_time, "bucket")
+
+    def explain_aggregate(collection_name: str, pipeline: list[dict]):
+        return db.command("explain", {"aggregate": collection_name, "cursor": {}, "pipeline": pipeline},
+                          verbosity="queryPlanner")
+
+    names = ["/recent-data", "/recent-data:counts", "/recent-data:estimate", "/sentiment-summary",
+             "/subreddit-stats", "/sentiment-timeline"]
+    plans = dict(zip(names, await asyncio.gather(
+        collection.find(query).sort([("now_time", -1), ("_id", -1)]).limit(101).explain(),
+        explain_aggregate(COLLECTION_NAME, window_counts_pipeline(query)),
+        explain_aggregate(ROLLUP_COLLECTION_NAME, rollup_window_counts_pipeline(bucket_query)),
+        explain_aggregate(ROLLUP_COLLECTION_NAME, sentiment_summary_pipeline(bucket_query)),
+        explain_aggregate(ROLLUP_COLLECTION_NAME, subreddit_stats_pipeline(bucket_query)),
+        explain_aggregate(ROLLUP_COLLECTION_NAME, sentiment_timeline_pipeline(bucket_query, 300)),
+    )))
+    report = {}
+    for name, plan in plans.items():
+        stages = _plan_stages(plan)
+        report[name] = {"stages": sorted(stages), "collscan": "COLLSCAN" in stages}
+        if "COLLSCAN" in stages:
+            logger.warning(f"{name} query does a collection scan")
+    return report
+
+@app.get("/diagnostics/query-plans")
+async def get_query_plans(hours: int = 24):
+    """explain() the endpoint queries and flag collection scans"""
+    if mongo_client is None:
+        raise HTTPException(status_code=503, detail="MongoDB not connected")
+    return {"time_range_hours": hours, "queries": await explain_queries(hours)}
+
 @app.get("/metrics")
 def metrics():
     """Prometheus metrics endpoint"""
@@ -1,13 +1,18 @@
 import os
+import sys
 import json
-import base64
+import threading
 import requests
 import schedule
 import time
+from collections import deque
 from datetime import datetime, timezone, timedelta
 
-from src.pipelines import top_posts_subreddit_pipeline
+from src.pipelines import analyze_sentiment, top_posts_subreddit_pipeline
+from src import instrumentation
+from src.github_sink import GitHubBatchSink
 from src.logger_config import setup_logger
+from src.state_store import SentimentStateStore
 
 logger = setup_logger()
 
@@ -17,6 +22,21 @@ OUTPUT_ROOT = "reddit/sentiment"
 POOL_SIZE = 10     
 COMMENT_LIMIT = 5 
 
+# 常驻模式：每隔 RUN_INTERVAL_MINUTES 跑一次，加上 ±RUN_JITTER_SECONDS 的随机抖动
+RUN_INTERVAL_MINUTES = int(os.environ.get("RUN_INTERVAL_MINUTES", "240"))
+RUN_JITTER_SECONDS = int(os.environ.get("RUN_JITTER_SECONDS", "300"))
+RUN_HISTORY_SIZE = 50
+
+# 攒够 SYNC_BATCH_RUNS 次运行再合并成一个 commit 上传
+SYNC_BATCH_RUNS = int(os.environ.get("SYNC_BATCH_RUNS", "1"))
+SYNC_SPOOL_DIR = os.environ.get("SYNC_SPOOL_DIR", ".sync_spool")
+
+# 跨运行的情绪状态库
+STATE_DB = os.environ.get("STATE_DB", "sentiment_state.db")
+
+# 每次运行的分阶段耗时报告
+RUN_REPORT_PATH = os.environ.get("RUN_REPORT_PATH", "run_report.json")
+
 # ⚠️ 这里留空，让脚本优先读环境变量。如果在服务器跑，我们用 export 命令注入 Token
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN", "")
 
@@ -29,12 +49,17 @@ def get_github_headers():
         "Accept": "application/vnd.github.v3+json"
     }
 
+# GitHub API 连接复用
+github_session = requests.Session()
+sink = None
+state_store = None
+
 def fetch_missions():
     headers = get_github_headers()
     if not headers: return {}
     try:
         url = f"https://api.github.com/repos/{COMMAND_REPO}/issues?state=open"
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = github_session.get(url, headers=headers, timeout=10)
         if resp.status_code != 200: return {}
         
         missions = {}
@@ -48,42 +73,25 @@ def fetch_missions():
         logger.error(f"Fetch missions failed: {e}")
         return {}
 
-def sync_to_central_bank(data_batch):
-    headers = get_github_headers()
-    if not headers: return
+def get_sink():
+    global sink
+    if sink is None and GITHUB_TOKEN:
+        sink = GitHubBatchSink(
+            COMMAND_REPO, GITHUB_TOKEN, OUTPUT_ROOT,
+            spool_dir=SYNC_SPOOL_DIR, batch_size=SYNC_BATCH_RUNS,
+        )
+    return sink
 
-    now = datetime.now(timezone(timedelta(hours=8)))
-    
-    # === 修改部分：既要文件夹，又要长文件名 ===
-    # 1. 制造文件夹路径 (YYYY/MM/DD)
-    folder_path = now.strftime('%Y/%m/%d')
-    
-    # 2. 制造文件名 (YYYY-MM-DD-HHMMSS.json)
-    file_name = now.strftime('%Y-%m-%d-%H%M%S')
-    
-    # 3. 拼在一起！(reddit/sentiment/2026/02/05/2026-02-05-012338.json)
-    path = f"{OUTPUT_ROOT}/{folder_path}/{file_name}.json"
-    # ==========================================
-    
-    api_url = f"https://api.github.com/repos/{COMMAND_REPO}/contents/{path}"
-    
-    try:
-        final_content = json.dumps([data_batch], indent=2, ensure_ascii=False)
-        b64_content = base64.b64encode(final_content.encode('utf-8')).decode('utf-8')
-        
-        payload = {
-            "message": f"🤖 Reddit Incremental: {now.strftime('%H:%M:%S')}",
-            "content": b64_content,
-            "branch": "main"
-        }
-        
-        resp = requests.put(api_url, headers=headers, json=payload)
-        if resp.status_code in [200, 201]:
-            logger.info(f"✅ Data synced to {path}")
-        else:
-            logger.error(f"❌ Upload failed: {resp.status_code} {resp.text}")
-    except Exception as e:
-        logger.error(f"Sync failed: {e}")
+def get_state():
+    global state_store
+    if state_store is None:
+        state_store = SentimentStateStore(STATE_DB)
+    return state_store
+
+def sync_to_central_bank(data_batch):
+    if not get_github_headers(): return
+    # 先落盘再上传；失败的批次留在 spool 目录，下次 flush 一起补传
+    get_sink().add(data_batch)
 
 def job():
     logger.info("⏰ Job started...")
@@ -98,13 +106,10 @@ def job():
     
     for sub in missions.keys():
         try:
-            posts = top_posts_subreddit_pipeline(sub, POOL_SIZE, COMMENT_LIMIT, "Hot")
+            with instrumentation.stage("subreddit") as span:
+                posts = top_posts_subreddit_pipeline(sub, POOL_SIZE, COMMENT_LIMIT, "Hot")
+                span.items = len(posts)
             if not posts: continue
-            
-            for p in posts:
-                vibe = float(p.get('vibe_val', 0))
-                score = int(p.get('score', 0))
-                p['rank_score'] = score * (abs(vibe) + 0.1)
 
             champions = sorted(posts, key=lambda x: x['rank_score'], reverse=True)[:5]
             
@@ -121,10 +126,19 @@ def job():
                     "summary": p.get('clean_text', '')[:100]
                 })
             
+            # 跨运行的滚动统计，增量更新，不用回看历史
+            state = get_state()
+            state.update(sub, posts)
+            rolling = state.summary(sub)
+
             batch_results.append({
                 "subreddit": sub,
                 "avg_sentiment": avg_vibe,
-                "champions": champion_list
+                "champions": champion_list,
+                "rolling_post_count": rolling["post_count"],
+                "rolling_avg_sentiment": rolling["rolling_avg_sentiment"],
+                "ewma_sentiment": rolling["ewma_sentiment"],
+                "rolling_champions": rolling["champions"],
             })
             
         except Exception as e:
@@ -137,5 +151,61 @@ def job():
         }
         sync_to_central_bank(payload)
 
+def instrumented_job():
+    instrumentation.reset()
+    try:
+        with instrumentation.profile_run(), instrumentation.stage("job"):
+            job()
+    finally:
+        instrumentation.write_run_report(RUN_REPORT_PATH)
+
+# === 常驻模式 ===
+run_lock = threading.Lock()
+run_history = deque(maxlen=RUN_HISTORY_SIZE)
+
+def timed_job():
+    # 上一轮还没跑完就直接跳过，不叠加
+    if not run_lock.acquire(blocking=False):
+        logger.warning("⏭️ Previous run still in progress, skipping this tick.")
+        return
+    started = time.time()
+    status = "ok"
+    try:
+        instrumented_job()
+    except Exception as e:
+        status = f"error: {e}"
+        logger.error(f"Job crashed: {e}")
+    finally:
+        run_lock.release()
+        record = {
+            "started": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+            "duration_s": round(time.time() - started, 2),
+            "status": status,
+        }
+        run_history.append(record)
+        logger.info(f"⏱️ Run finished: {json.dumps(record)}")
+
+def run_in_background():
+    threading.Thread(target=timed_job, name="headless-job", daemon=True).start()
+
+def warm_up():
+    # 预热：TextBlob 语料和 HTTP 连接池在第一次用时才加载
+    analyze_sentiment("warm up")
+
+def daemon():
+    warm_up()
+    low = max(60, RUN_INTERVAL_MINUTES * 60 - RUN_JITTER_SECONDS)
+    high = RUN_INTERVAL_MINUTES * 60 + RUN_JITTER_SECONDS
+    schedule.every(low).to(high).seconds.do(run_in_background)
+    logger.info(f"🛰️ Daemon started: every {low}-{high}s")
+
+    run_in_background()
+    while True:
+        schedule.run_pending()
+        time.sleep(max(1, min(30, schedule.idle_seconds() or 30)))
+
 if __name__ == "__main__":
-    job()
+    if "--daemon" in sys.argv[1:]:
+        daemon()
+    else:
+        instrumented_job()
@@ -13,6 +13,7 @@ import uvicorn
 PREDICTION_REQUESTS = Counter("prediction_requests_total", "Total number of prediction requests")
 PREDICTION_ERRORS = Counter("prediction_errors_total", "Total number of failed prediction requests")
 PREDICTION_LATENCY = Histogram("prediction_latency_seconds", "Prediction latency in seconds")
+BATCH_SIZE = Histogram("prediction_batch_size", "Texts per batch prediction request", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
 
 logger = logging.getLogger("uvicorn")
 
@@ -28,6 +29,19 @@ class LabelScore(BaseModel):
 class GetInferenceResponse(BaseModel):
     inference: List[LabelScore]
 
+class GetInferenceBatchRequest(BaseModel):
+    texts: List[str]
+
+class GetInferenceBatchResponse(BaseModel):
+    inferences: List[List[LabelScore]]
+
+def score_text(text: str) -> list[dict]:
+    assert ANALYZER is not None, "Sentiment analyzer not initialized"
+    scores = ANALYZER.polarity_scores(text)
+    label = "POSITIVE" if scores["compound"] >= 0 else "NEGATIVE"
+    score = max(scores["pos"], scores["neg"])
+    return [{"label": label, "score": float(score)}]
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global ANALYZER
@@ -44,12 +58,24 @@ async def get_inference(payload: GetInferenceRequest) -> GetInferenceResponse:
     PREDICTION_REQUESTS.inc()
 
     try:
-        assert ANALYZER is not None, "Sentiment analyzer not initialized"
-        scores = ANALYZER.polarity_scores(payload.text)
-        label = "POSITIVE" if scores["compound"] >= 0 else "NEGATIVE"
-        score = max(scores["pos"], scores["neg"])
-        prediction = [{"label": label, "score": float(score)}]
-        return GetInferenceResponse(inference=prediction)
+        return GetInferenceResponse(inference=score_text(payload.text))
+
+    except Exception:
+        PREDICTION_ERRORS.inc()
+        raise
+    finally:
+        latency = time.time() - start_time
+        PREDICTION_LATENCY.observe(latency)
+
+@app.post("/get-inference-batch", response_model=GetInferenceBatchResponse)
+async def get_inference_batch(payload: GetInferenceBatchRequest) -> GetInferenceBatchResponse:
+    """Score many texts in one request; results are in input order."""
+    start_time = time.time()
+    PREDICTION_REQUESTS.inc()
+    BATCH_SIZE.observe(len(payload.texts))
+
+    try:
+        return GetInferenceBatchResponse(inferences=[score_text(text) for text in payload.texts])
 
     except Exception:
         PREDICTION_ERRORS.inc()
@@ -1,37 +1,482 @@
-import os, json, requests, pika
+import os, sys, json, gzip, time, asyncio, queue, threading, multiprocessing, requests, pika
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import aio_pika
+import httpx
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from prometheus_client import Counter as MetricCounter, Histogram, start_http_server
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
-def get_inference(url: str, text: str) -> dict[str, dict[str, str | int]]:
-    resp = requests.post(url, json={"text": text}, timeout=10)
+# 能解析的消息格式版本；没有 x-schema-version 头的旧消息按 1 处理
+SUPPORTED_SCHEMA_VERSIONS = {1}
+
+class UnsupportedSchemaVersion(ValueError):
+    pass
+
+def schema_version(headers: dict | None) -> int:
+    version = (headers or {}).get("x-schema-version", 1)
+    try:
+        return int(version.decode() if isinstance(version, bytes) else version)
+    except (TypeError, ValueError):
+        raise UnsupportedSchemaVersion(f"invalid x-schema-version {version!r}")
+
+def decode_message(body: bytes, properties) -> dict:
+    """
+    Decode a producer message using its `content_encoding` / `content_type`
+    properties. Messages without them are the original plain-JSON format.
+    Unknown `x-schema-version`s raise, so they are dead-lettered instead of
+    being read as version 1.
+    """
+    version = schema_version(getattr(properties, "headers", None))
+    if version not in SUPPORTED_SCHEMA_VERSIONS:
+        raise UnsupportedSchemaVersion(f"unsupported x-schema-version {version}")
+
+    encoding = getattr(properties, "content_encoding", None)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd-compressed message but zstandard is not installed")
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif encoding == "gzip":
+        body = gzip.decompress(body)
+
+    if getattr(properties, "content_type", None) == "application/msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack message but msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body.decode("utf-8"))
+
+
+# 本进程的处理计数，supervisor 模式下定期上报
+stats: Counter[str] = Counter()
+
+STAGE_LATENCY = Histogram("consumer_stage_seconds", "Time spent per processing stage", ["stage"])
+BATCH_SIZE = Histogram("consumer_batch_size", "Messages per processed batch", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+MESSAGES = MetricCounter("consumer_messages_total", "Messages processed, by outcome", ["outcome"])
+ERRORS = MetricCounter("consumer_errors_total", "Processing errors, by stage", ["stage"])
+# 生产者抓取时间 (now_time) 到写入 Mongo 的时间差
+END_TO_END_LAG = Histogram("consumer_end_to_end_lag_seconds", "Seconds from the producer's now_time to the Mongo write",
+                           buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+
+def observe_lag(docs: list[dict]) -> None:
+    now = time.time()
+    for doc in docs:
+        if doc.get("now_time"):
+            END_TO_END_LAG.observe(max(0.0, now - float(doc["now_time"])))
+
+
+http = requests.Session()
+
+def get_inference_batch(url: str, texts: list[str]) -> list[list[dict[str, str | float]]]:
+    """Score all `texts` with one call to the model-server's batch endpoint."""
+    resp = http.post(url, json={"texts": texts}, timeout=30)
     resp.raise_for_status()
-    return resp.json()
+    return resp.json()["inferences"]
+
+class HttpScorer:
+    """Scores through the model-server, for heavy models shared between consumers."""
+    def __init__(self, batch_url: str, max_connections: int = 32):
+        self.batch_url = batch_url
+        self.max_connections = max_connections
+        self._client: httpx.AsyncClient | None = None
+
+    def score_batch(self, texts: list[str]) -> list[list[dict]]:
+        return get_inference_batch(self.batch_url, texts)
+
+    async def score_batch_async(self, texts: list[str]) -> list[list[dict]]:
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_connections)
+            self._client = httpx.AsyncClient(limits=limits, timeout=10)
+        resp = await self._client.post(self.batch_url, json={"texts": texts})
+        resp.raise_for_status()
+        return resp.json()["inferences"]
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+
+# 进程内推理：与 model-server 的 /get-inference 同样的 VADER 打分规则
+_analyzer = None
+
+def _load_analyzer() -> None:
+    global _analyzer
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    _analyzer = SentimentIntensityAnalyzer()
+
+def score_text(text: str) -> list[dict[str, str | float]]:
+    scores = _analyzer.polarity_scores(text)
+    label = "POSITIVE" if scores["compound"] >= 0 else "NEGATIVE"
+    score = max(scores["pos"], scores["neg"])
+    return [{"label": label, "score": float(score)}]
+
+def _score_chunk(texts: list[str]) -> list[list[dict]]:
+    return [score_text(text) for text in texts]
+
+class LocalScorer:
+    """
+    Runs the VADER analyzer inside the consumer, skipping the network hop.
+    With `workers` > 1 a batch is split across a process pool, since VADER is
+    pure Python and threads would serialise on the GIL.
+    """
+    def __init__(self, workers: int = 0):
+        self.workers = workers
+        self.pool = None
+        if workers > 1:
+            self.pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_load_analyzer)
+        else:
+            _load_analyzer()
+
+    def _chunks(self, texts: list[str]) -> list[list[str]]:
+        size = -(-len(texts) // self.workers)
+        return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+    def score_batch(self, texts: list[str]) -> list[list[dict]]:
+        if self.pool is None:
+            return _score_chunk(texts)
+        return [r for chunk in self.pool.map(_score_chunk, self._chunks(texts)) for r in chunk]
+
+    async def score_batch_async(self, texts: list[str]) -> list[list[dict]]:
+        if self.pool is None:
+            return _score_chunk(texts)
+        return await asyncio.wrap_future(self.pool.submit(_score_chunk, texts))
+
+    async def aclose(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+
+def make_scorer(mode: str, batch_url: str, workers: int = 0, max_connections: int = 32):
+    return LocalScorer(workers) if mode == "local" else HttpScorer(batch_url, max_connections)
+
+# 写入时顺带存下紧凑的情感字段，API 直接按标量字段计数 / $group
+LABEL_CODES = {"POSITIVE": 1, "NEGATIVE": -1}
+
+def _label_code(sentiment: list[dict] | None) -> int | None:
+    if not sentiment:
+        return None
+    return LABEL_CODES.get(sentiment[0].get("label"), 0)
+
+def sentiment_fields(doc: dict) -> dict:
+    """
+    Scalar copies of the sentiment arrays: `title_label` / `selftext_label`
+    codes (1 positive, -1 negative, 0 neutral, None if unscored) and the
+    primary `sentiment_label` / `sentiment_score`, taken from the title and
+    falling back to the selftext.
+    """
+    primary = doc.get("title_sentiment") or doc.get("selftext_sentiment") or []
+    return {
+        "title_label": _label_code(doc.get("title_sentiment")),
+        "selftext_label": _label_code(doc.get("selftext_sentiment")),
+        "sentiment_label": _label_code(primary),
+        "sentiment_score": float(primary[0].get("score", 0.0)) if primary else None,
+    }
+
+DUPLICATE_KEY = 11000
+INDEX_OPTIONS_CONFLICT = 85
+
+# subreddit + 时间桶的预聚合，API 按桶数而不是帖子数计算
+ROLLUP_COLLECTION = "post_rollups"
+CODE_NAMES = {1: "positive", -1: "negative", 0: "neutral"}
+
+def rollup_updates(docs: list[dict], bucket_seconds: int) -> list[UpdateOne]:
+    """
+    $inc upserts adding `docs` to their (subreddit, bucket) rollups: post
+    count, per-field label counts and per-label sums of `sentiment_score`.
+    The bucket is the start of the `now_time` interval, in epoch seconds.
+    """
+    buckets: dict[tuple, Counter] = {}
+    for doc in docs:
+        if doc.get("now_time") is None:
+            continue
+        bucket = int(doc["now_time"]) // bucket_seconds * bucket_seconds
+        inc = buckets.setdefault((doc.get("subreddit"), bucket), Counter())
+        inc["posts"] += 1
+        for field in ("title", "selftext"):
+            if doc.get(f"{field}_label") in CODE_NAMES:
+                inc[f"{field}_{CODE_NAMES[doc[f'{field}_label']]}"] += 1
+        if doc.get("sentiment_label") in CODE_NAMES and doc.get("sentiment_score") is not None:
+            inc[f"{CODE_NAMES[doc['sentiment_label']]}_score_sum"] += doc["sentiment_score"]
+    return [UpdateOne({"subreddit": subreddit, "bucket": bucket}, {"$inc": dict(inc)}, upsert=True)
+            for (subreddit, bucket), inc in buckets.items()]
+
+def rollup_rebuild_pipeline(bucket_seconds: int) -> list[dict]:
+    """Recompute every rollup from the posts collection; same fields as `rollup_updates`."""
+    bucket = {"$subtract": [{"$toLong": "$now_time"}, {"$mod": [{"$toLong": "$now_time"}, bucket_seconds]}]}
+    sums = {"posts": {"$sum": 1}}
+    for code, name in CODE_NAMES.items():
+        for field in ("title", "selftext"):
+            sums[f"{field}_{name}"] = {"$sum": {"$cond": [{"$eq": [f"${field}_label", code]}, 1, 0]}}
+        sums[f"{name}_score_sum"] = {"$sum": {"$cond": [{"$eq": ["$sentiment_label", code]},
+                                                        {"$ifNull": ["$sentiment_score", 0]}, 0]}}
+    return [
+        {"$match": {"now_time": {"$type": "number"}}},
+        {"$group": {"_id": {"subreddit": "$subreddit", "bucket": bucket}, **sums}},
+        {"$project": {"_id": 0, "subreddit": "$_id.subreddit", "bucket": "$_id.bucket", **{k: 1 for k in sums}}},
+        {"$out": ROLLUP_COLLECTION},
+    ]
+
+def _rollup_retries(ops: list[UpdateOne], error: BulkWriteError) -> list[UpdateOne]:
+    # 两个 worker 同时 upsert 同一个新桶，输的一方撞唯一索引，重做一次即可
+    errors = error.details.get("writeErrors", [])
+    if any(err.get("code") != DUPLICATE_KEY for err in errors):
+        raise error
+    return [ops[err["index"]] for err in errors]
+
+# 首次写入后不再改动的字段：rollup 按 now_time 分桶，重复发布不能把文档挪到别的桶
+INSERT_ONLY_FIELDS = ("now_time", "created_utc")
+
+def upsert_update(doc: dict) -> dict:
+    """Update document for an upsert keyed on `id`: insert-only fields go under `$setOnInsert`."""
+    update = {"$set": {k: v for k, v in doc.items() if k not in INSERT_ONLY_FIELDS}}
+    on_insert = {k: doc[k] for k in INSERT_ONLY_FIELDS if k in doc}
+    if on_insert:
+        update["$setOnInsert"] = on_insert
+    return update
+
+def _upsert(doc: dict):
+    # 以 Reddit 帖子 id 为键：重投递 / 重复发布只会覆盖同一条文档
+    return UpdateOne({"id": doc["id"]}, upsert_update(doc), upsert=True) if doc.get("id") else InsertOne(doc)
 
 class MongoLogger:
-    def __init__(self, uri="mongodb://mongo:27017", db_name="redditPosts", collection="posts"):
+    def __init__(self, uri="mongodb://mongo:27017", db_name="redditPosts", collection="posts",
+                 rollup_bucket_seconds=60, create_indexes=True):
         self.client = MongoClient(uri)                # one client for the whole process
         self.collection = self.client[db_name][collection]
+        self.rollups = self.client[db_name][ROLLUP_COLLECTION]
+        self.rollup_bucket_seconds = rollup_bucket_seconds
+        if create_indexes:
+            self.ensure_indexes()
+
+    def ensure_indexes(self) -> None:
+        """
+        Unique index on the Reddit id, limited to documents that have one so
+        id-less posts (written with InsertOne) don't all collide on null.
+        Refuses to start if existing posts share an id.
+        """
+        self.rollups.create_index([("subreddit", 1), ("bucket", 1)], unique=True, name="subreddit_bucket_unique")
+        try:
+            self._create_id_index()
+        except OperationFailure as e:
+            if e.code == INDEX_OPTIONS_CONFLICT:
+                # 早先建的是非 partial 的同名索引，换成 partial 的
+                print("replacing non-partial reddit_id_unique index")
+                self.collection.drop_index("reddit_id_unique")
+                return self.ensure_indexes()
+            if e.code != DUPLICATE_KEY:
+                raise
+            raise RuntimeError(
+                f"cannot create unique index on {self.collection.full_name}.id: the collection already holds "
+                f"duplicate posts. Run `python main.py remove-duplicates` once, then restart the consumer."
+            ) from e
+
+    def _create_id_index(self) -> None:
+        self.collection.create_index("id", unique=True, name="reddit_id_unique",
+                                     partialFilterExpression={"id": {"$type": "string"}})
+
+    def remove_duplicates(self) -> int:
+        """Keep the oldest document (lowest `_id`) for every Reddit id and delete the rest."""
+        removed = 0
+        pipeline = [
+            # 没有 id 的帖子互不相同，不能当成同一个 null id 合并
+            {"$match": {"id": {"$type": "string"}}},
+            # $push 保留输入顺序，先排序才能确定留下的是哪一条
+            {"$sort": {"_id": 1}},
+            {"$group": {"_id": "$id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ]
+        for group in self.collection.aggregate(pipeline, allowDiskUse=True):
+            removed += self.collection.delete_many({"_id": {"$in": group["ids"][1:]}}).deleted_count
+        return removed
+
+    def backfill_sentiment_fields(self, batch_size: int = 1000) -> int:
+        """
+        Add the `sentiment_fields` to documents written before they existed,
+        `batch_size` documents per bulk write, walking `_id` in order.
+        """
+        updated, last_id = 0, None
+        query = {"sentiment_label": {"$exists": False}}
+        while True:
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            docs = list(self.collection.find(query, {"title_sentiment": 1, "selftext_sentiment": 1})
+                        .sort("_id", 1).limit(batch_size))
+            if not docs:
+                return updated
+            self.collection.bulk_write([UpdateOne({"_id": d["_id"]}, {"$set": sentiment_fields(d)}) for d in docs],
+                                       ordered=False)
+            updated += len(docs)
+            last_id = docs[-1]["_id"]
+            print(f"backfilled {updated} documents")
 
     def log(self, doc: dict) -> None:
-        self.collection.insert_one(doc)
+        self.collection.bulk_write([_upsert(doc)])
 
-def make_callback(mongo: MongoLogger, ml_url: str):
-    def callback(ch, method, properties, body: bytes):
+    def log_many(self, docs: list[dict]) -> set[int]:
+        """
+        Upsert `docs` in one unordered bulk write; returns the indexes that
+        failed. Posts that were new to the collection are added to the rollups.
+        """
         try:
-            data = json.loads(body.decode("utf-8"))
-            # Add subreddit from queue name
-            data["subreddit"] = method.routing_key
-            data["title_sentiment"] = get_inference(ml_url, data.get("title", ""))['inference']
-            data["selftext_sentiment"] = get_inference(ml_url, data.get("selftext", ""))['inference']
-
-            mongo.log(data)
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            print(f"processing error: {e!r}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-    return callback
+            result = self.collection.bulk_write([_upsert(doc) for doc in docs], ordered=False)
+            errors, upserted = [], set(result.upserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            upserted = {u["index"] for u in e.details.get("upserted", [])}
+        errored = {err["index"] for err in errors}
+        # 只统计首次写入的帖子，重复抓取 / 重投递不会重复计数
+        new = [doc for i, doc in enumerate(docs) if i in upserted or (not doc.get("id") and i not in errored)]
+        if new and self.rollup_bucket_seconds:
+            try:
+                self.write_rollups(new)
+            except Exception as e:
+                # 帖子已写入，汇总失败不重试消息；rebuild-rollups 可以补齐
+                print(f"rollup update failed: {e!r}")
+                ERRORS.labels("rollup").inc()
+        # 并发 upsert 撞上唯一索引说明文档已经在了，不算失败
+        return {err["index"] for err in errors if err.get("code") != DUPLICATE_KEY}
+
+    def write_rollups(self, docs: list[dict]) -> None:
+        ops = rollup_updates(docs, self.rollup_bucket_seconds)
+        try:
+            self.rollups.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            self.rollups.bulk_write(_rollup_retries(ops, e), ordered=False)
+
+    def rebuild_rollups(self) -> int:
+        """Replace the rollup collection with one recomputed from all stored posts."""
+        self.collection.aggregate(rollup_rebuild_pipeline(self.rollup_bucket_seconds), allowDiskUse=True)
+        return self.rollups.count_documents({})
+
+class RetryRouter:
+    """
+    Retry handling built from plain queues, so the existing main queue keeps
+    its arguments. A failed message is republished to `<queue>.retry.<n>`,
+    whose TTL (base_delay * 2**n) dead-letters it back to the main queue; the
+    attempt count travels in the `x-attempt` header. Once `max_attempts` is
+    reached, or for undecodable messages, it goes to `<queue>.dlq` instead.
+    """
+    def __init__(self, queue_name: str, max_attempts: int = 5, base_delay_ms: int = 1000, levels: int = 5):
+        self.queue_name = queue_name
+        self.max_attempts = max_attempts
+        self.base_delay_ms = base_delay_ms
+        self.levels = levels
+        self.dlq = f"{queue_name}.dlq"
+
+    def retry_queue(self, level: int) -> str:
+        return f"{self.queue_name}.retry.{level}"
+
+    def queue_arguments(self) -> dict[str, dict]:
+        queues = {self.dlq: {}}
+        for level in range(self.levels):
+            queues[self.retry_queue(level)] = {
+                "x-message-ttl": self.base_delay_ms * 2 ** level,
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": self.queue_name,
+            }
+        return queues
+
+    def declare(self, channel) -> None:
+        for name, arguments in self.queue_arguments().items():
+            channel.queue_declare(queue=name, durable=True, arguments=arguments or None)
+
+    def route(self, headers: dict | None, routing_key: str, error: Exception,
+              retryable: bool) -> tuple[str, dict]:
+        """Destination queue and headers for the next copy of a failed message."""
+        headers = dict(headers or {})
+        attempt = int(headers.get("x-attempt", 0)) + 1
+        headers["x-attempt"] = attempt
+        headers["x-last-error"] = repr(error)[:500]
+        # 重试后 routing key 会变成主队列名，这里记下原始值
+        headers.setdefault("x-original-routing-key", routing_key)
+        if not retryable or attempt >= self.max_attempts:
+            return self.dlq, headers
+        return self.retry_queue(min(attempt - 1, self.levels - 1)), headers
+
+    def reject(self, channel, method, properties, body: bytes, error: Exception, retryable: bool) -> str:
+        destination, headers = self.route(properties.headers, method.routing_key, error, retryable)
+        channel.basic_publish(exchange="", routing_key=destination, body=body,
+                              properties=pika.BasicProperties(
+                                  delivery_mode=2,
+                                  content_type=properties.content_type,
+                                  content_encoding=properties.content_encoding,
+                                  headers=headers,
+                              ))
+        return destination
+
+def _origin(routing_key: str, headers: dict | None) -> str:
+    return (headers or {}).get("x-original-routing-key") or routing_key
+
+def make_batch_handler(mongo: MongoLogger, scorer, router: RetryRouter):
+    """
+    Process a batch of (method, properties, body) deliveries: one inference
+    call for every title and selftext, one bulk write, then a single
+    multiple=True ack. Failed messages are first handed to the RetryRouter
+    (delay queue or dead-letter queue), so the ack covers them too.
+    """
+    def handle(ch, messages):
+        decoded, failed = [], []
+        for delivery in messages:
+            method, properties, body = delivery
+            try:
+                with STAGE_LATENCY.labels("decode").time():
+                    data = decode_message(body, properties)
+                # Add subreddit from queue name unless the producer already set it
+                data["subreddit"] = data.get("subreddit") or _origin(method.routing_key, properties.headers)
+                decoded.append((delivery, data))
+            except Exception as e:
+                print(f"decode error: {e!r}")
+                ERRORS.labels("decode").inc()
+                failed.append((delivery, e, False))
+
+        if decoded:
+            step = "inference"
+            try:
+                texts = [d.get("title", "") for _, d in decoded] + [d.get("selftext", "") for _, d in decoded]
+                with STAGE_LATENCY.labels("inference").time():
+                    inferences = scorer.score_batch(texts)
+                for i, (_, data) in enumerate(decoded):
+                    data["title_sentiment"] = inferences[i]
+                    data["selftext_sentiment"] = inferences[len(decoded) + i]
+                    data.update(sentiment_fields(data))
+                step = "mongo_write"
+                with STAGE_LATENCY.labels("mongo_write").time():
+                    bad = mongo.log_many([data for _, data in decoded])
+                if bad:
+                    ERRORS.labels("mongo_write").inc(len(bad))
+                observe_lag([data for i, (_, data) in enumerate(decoded) if i not in bad])
+                error = RuntimeError("mongo write failed")
+            except Exception as e:
+                print(f"batch processing error: {e!r}")
+                ERRORS.labels(step).inc()
+                bad, error = set(range(len(decoded))), e
+            failed += [(delivery, error, True) for i, (delivery, _) in enumerate(decoded) if i in bad]
+
+        for (method, properties, body), error, retryable in failed:
+            destination = router.reject(ch, method, properties, body, error, retryable)
+            outcome = "dead_lettered" if destination == router.dlq else "retried"
+            stats[outcome] += 1
+            MESSAGES.labels(outcome).inc()
+        with STAGE_LATENCY.labels("ack").time():
+            ch.basic_ack(delivery_tag=max(method.delivery_tag for method, _, _ in messages), multiple=True)
+        MESSAGES.labels("acked").inc(len(messages) - len(failed))
+        BATCH_SIZE.observe(len(messages))
+        stats["batches"] += 1
+        stats["messages"] += len(messages)
+        stats["acked"] += len(messages) - len(failed)
+        stats["failed"] += len(failed)
+    return handle
 
 class RabbitMQConsumer:
     def __init__(self, username: str, password: str, port: int, host: str):
@@ -40,27 +485,353 @@ class RabbitMQConsumer:
         self.conn = pika.BlockingConnection(params)
         self.channel = self.conn.channel()
 
-    def consume(self, queue_name: str, cb):
+    def replay_dead_letters(self, router: RetryRouter, limit: int | None = None, chunk: int = 500) -> int:
+        """
+        Move messages from the dead-letter queue back to the main queue with a
+        fresh attempt count. Each chunk is acked only after its republishes
+        have been confirmed.
+        """
+        router.declare(self.channel)
+        self.channel.confirm_delivery()
+        replayed = 0
+        while limit is None or replayed < limit:
+            last_tag = None
+            for _ in range(chunk if limit is None else min(chunk, limit - replayed)):
+                method, properties, body = self.channel.basic_get(router.dlq, auto_ack=False)
+                if method is None:
+                    break
+                headers = {k: v for k, v in (properties.headers or {}).items()
+                           if k not in ("x-attempt", "x-last-error", "x-death")}
+                self.channel.basic_publish(exchange="", routing_key=router.queue_name, body=body,
+                                           properties=pika.BasicProperties(
+                                               delivery_mode=2,
+                                               content_type=properties.content_type,
+                                               content_encoding=properties.content_encoding,
+                                               headers=headers,
+                                           ))
+                last_tag = method.delivery_tag
+                replayed += 1
+            if last_tag is None:
+                break
+            self.channel.basic_ack(delivery_tag=last_tag, multiple=True)
+        return replayed
+
+    def consume_batches(self, queue_name: str, handler, router: RetryRouter, batch_size: int = 50,
+                        max_wait_ms: int = 200, prefetch_count: int | None = None):
+        """
+        Gather up to `batch_size` messages, or whatever arrived within
+        `max_wait_ms` of the first one, and hand them to `handler` together.
+        """
         self.channel.queue_declare(queue=queue_name, durable=True)
-        self.channel.basic_qos(prefetch_count=5)
-        self.channel.basic_consume(queue=queue_name, on_message_callback=cb, auto_ack=False)
-        self.channel.start_consuming()
+        router.declare(self.channel)
+        # 失败消息转投重试队列后才 ack 原消息，需要 broker 确认
+        self.channel.confirm_delivery()
+        # prefetch 至少要能装下一整批
+        self.channel.basic_qos(prefetch_count=max(prefetch_count or 5, batch_size))
+        max_wait = max_wait_ms / 1000
+        batch, batch_started = [], 0.0
+        for method, properties, body in self.channel.consume(queue_name, auto_ack=False, inactivity_timeout=max_wait):
+            if method is not None:
+                if not batch:
+                    batch_started = time.monotonic()
+                batch.append((method, properties, body))
+            if batch and (len(batch) >= batch_size or time.monotonic() - batch_started >= max_wait):
+                handler(self.channel, batch)
+                batch = []
 
-if __name__ == "__main__":
+async def consume_async(amqp_url: str, queue_name: str, mongo_uri: str, scorer,
+                        router: RetryRouter, max_in_flight: int = 32, rollup_bucket_seconds: int = 60):
+    """
+    Asyncio consumer: keeps up to `max_in_flight` messages in progress at once
+    over one AMQP channel, one scorer (pooled HTTP client or local analyzer)
+    and one async Mongo client.
+    Each message is acked only after its document is written (at-least-once).
+    """
+    connection = await aio_pika.connect_robust(amqp_url)
+    channel = await connection.channel(publisher_confirms=True)
+    await channel.set_qos(prefetch_count=max_in_flight)
+    queue = await channel.declare_queue(queue_name, durable=True)
+    for name, arguments in router.queue_arguments().items():
+        await channel.declare_queue(name, durable=True, arguments=arguments or None)
+
+    async def reject(message, error: Exception, retryable: bool) -> None:
+        destination, headers = router.route(message.headers, message.routing_key, error, retryable)
+        await channel.default_exchange.publish(
+            aio_pika.Message(message.body, headers=headers, content_type=message.content_type,
+                             content_encoding=message.content_encoding,
+                             delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+            routing_key=destination,
+        )
+        outcome = "dead_lettered" if destination == router.dlq else "retried"
+        stats[outcome] += 1
+        MESSAGES.labels(outcome).inc()
+
+    mongo_client = AsyncMongoClient(mongo_uri, maxPoolSize=max_in_flight)
+    collection = mongo_client["redditPosts"]["posts"]
+    rollups = mongo_client["redditPosts"][ROLLUP_COLLECTION]
+    # 唯一索引（以及历史重复数据的清理）沿用同步实现，启动时做一次
+    MongoLogger(uri=mongo_uri).client.close()
+
+    async def write_rollups(doc: dict) -> None:
+        ops = rollup_updates([doc], rollup_bucket_seconds)
+        try:
+            await rollups.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            await rollups.bulk_write(_rollup_retries(ops, e), ordered=False)
+
+    in_flight = asyncio.Semaphore(max_in_flight)
+    tasks: set[asyncio.Task] = set()
+
+    async def process(message) -> None:
+        retryable, step = True, "decode"
+        try:
+            try:
+                with STAGE_LATENCY.labels("decode").time():
+                    data = decode_message(message.body, message)
+            except Exception:
+                retryable = False  # 解不开的消息重试也没用，直接进死信队列
+                raise
+            data["subreddit"] = data.get("subreddit") or _origin(message.routing_key, message.headers)
+            step = "inference"
+            with STAGE_LATENCY.labels("inference").time():
+                data["title_sentiment"], data["selftext_sentiment"] = await scorer.score_batch_async(
+                    [data.get("title", ""), data.get("selftext", "")]
+                )
+            data.update(sentiment_fields(data))
+            step = "mongo_write"
+            with STAGE_LATENCY.labels("mongo_write").time():
+                new = False
+                try:
+                    if data.get("id"):
+                        result = await collection.update_one({"id": data["id"]}, upsert_update(data), upsert=True)
+                        new = result.upserted_id is not None
+                    else:
+                        await collection.insert_one(data)
+                        new = True
+                except DuplicateKeyError:
+                    pass  # 另一个 worker 同时写入了同一帖子
+            observe_lag([data])
+            if new and rollup_bucket_seconds:
+                try:
+                    await write_rollups(data)
+                except Exception as rollup_error:
+                    print(f"rollup update failed: {rollup_error!r}")
+                    ERRORS.labels("rollup").inc()
+            step = "ack"
+            with STAGE_LATENCY.labels("ack").time():
+                await message.ack()
+            stats["acked"] += 1
+            MESSAGES.labels("acked").inc()
+        except Exception as e:
+            print(f"processing error: {e!r}")
+            ERRORS.labels(step).inc()
+            try:
+                await reject(message, e, retryable)
+                await message.ack()
+            except Exception as publish_error:
+                # 转投失败就退回原队列，至少不丢
+                print(f"retry publish failed: {publish_error!r}")
+                ERRORS.labels("retry_publish").inc()
+                await message.nack(requeue=True)
+            stats["failed"] += 1
+        finally:
+            stats["messages"] += 1
+            in_flight.release()
+
+    try:
+        async with queue.iterator() as messages:
+            async for message in messages:
+                await in_flight.acquire()
+                task = asyncio.create_task(process(message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await mongo_client.close()
+        await scorer.aclose()
+        await connection.close()
+
+def load_config() -> dict:
     load_dotenv()
-    rabbitmq_user = os.getenv("RABBITMQ_USER")
-    rabbitmq_password = os.getenv("RABBITMQ_PASSWORD")
-    rabbitmq_host = os.getenv("RABBITMQ_HOST")
-    rabbitmq_port = int(os.getenv("RABBITMQ_PORT"))
-    rabbitmq_queue_name = os.getenv("RABBITMQ_QUEUE_NAME")
+    inference_mode = os.getenv("INFERENCE_MODE", "http")
+    ml_batch_url = os.getenv("ML_BATCH_INFERENCE_URL")
+    if not ml_batch_url and inference_mode == "http":
+        # 没单独配批量地址时，从单条推理地址推出来；local 模式下两者都可以不配
+        ml_url = os.getenv("ML_INFERENCE_URL")
+        if not ml_url:
+            raise ValueError("INFERENCE_MODE=http needs ML_BATCH_INFERENCE_URL or ML_INFERENCE_URL")
+        ml_batch_url = ml_url.rsplit("/", 1)[0] + "/get-inference-batch"
+    return {
+        "rabbitmq_user": os.getenv("RABBITMQ_USER"),
+        "rabbitmq_password": os.getenv("RABBITMQ_PASSWORD"),
+        "rabbitmq_host": os.getenv("RABBITMQ_HOST"),
+        "rabbitmq_port": int(os.getenv("RABBITMQ_PORT")),
+        "queue_name": os.getenv("RABBITMQ_QUEUE_NAME"),
+        "ml_batch_url": ml_batch_url,
+        "batch_size": int(os.getenv("BATCH_SIZE", "50")),
+        "batch_max_wait_ms": int(os.getenv("BATCH_MAX_WAIT_MS", "200")),
+        "prefetch_count": int(os.getenv("PREFETCH_COUNT") or 0) or None,
+        "mongo_uri": os.getenv("MONGODB_URI", "mongodb://mongo:27017"),
+        # batch: 同步批处理；async: asyncio 并发处理
+        "consumer_mode": os.getenv("CONSUMER_MODE", "batch"),
+        "max_in_flight": int(os.getenv("MAX_IN_FLIGHT", "32")),
+        "workers": int(os.getenv("CONSUMER_WORKERS", "1")),
+        "stats_interval": float(os.getenv("STATS_INTERVAL_SECONDS", "10")),
+        "retry_max_attempts": int(os.getenv("RETRY_MAX_ATTEMPTS", "5")),
+        "retry_base_delay_ms": int(os.getenv("RETRY_BASE_DELAY_MS", "1000")),
+        "retry_levels": int(os.getenv("RETRY_LEVELS", "5")),
+        # http: 调 model-server；local: 进程内 VADER
+        "inference_mode": inference_mode,
+        "inference_workers": int(os.getenv("INFERENCE_WORKERS", "0")),
+        # 每个 worker 用 METRICS_PORT + worker_id，0 表示不开
+        "metrics_port": int(os.getenv("METRICS_PORT", "8002")),
+        # 预聚合桶大小（秒），0 表示不维护 rollup
+        "rollup_bucket_seconds": int(os.getenv("ROLLUP_BUCKET_SECONDS", "60")),
+    }
+
+def make_router(config: dict) -> RetryRouter:
+    return RetryRouter(config["queue_name"], max_attempts=config["retry_max_attempts"],
+                       base_delay_ms=config["retry_base_delay_ms"], levels=config["retry_levels"])
+
+def _report_stats(worker_id: int, stats_queue, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        stats_queue.put((worker_id, dict(stats)))
 
+def run_worker(config: dict, worker_id: int = 0, stats_queue=None) -> None:
+    """One consumer with its own connection and channel."""
+    if config["metrics_port"]:
+        start_http_server(config["metrics_port"] + worker_id)
+    if stats_queue is not None:
+        threading.Thread(target=_report_stats, args=(worker_id, stats_queue, config["stats_interval"]),
+                         daemon=True).start()
 
-    ml_url = os.getenv("ML_INFERENCE_URL")
+    if config["consumer_mode"] == "async":
+        amqp_url = (f"amqp://{config['rabbitmq_user']}:{config['rabbitmq_password']}"
+                    f"@{config['rabbitmq_host']}:{config['rabbitmq_port']}/")
+        scorer = make_scorer(config["inference_mode"], config["ml_batch_url"], config["inference_workers"],
+                             max_connections=config["max_in_flight"])
+        asyncio.run(consume_async(amqp_url, config["queue_name"], config["mongo_uri"], scorer,
+                                  make_router(config), max_in_flight=config["prefetch_count"] or config["max_in_flight"],
+                                  rollup_bucket_seconds=config["rollup_bucket_seconds"]))
+    else:
+        mongo = MongoLogger(uri=config["mongo_uri"],
+                            db_name="redditPosts",
+                            collection="posts",
+                            rollup_bucket_seconds=config["rollup_bucket_seconds"])
 
+        consumer = RabbitMQConsumer(config["rabbitmq_user"], config["rabbitmq_password"],
+                                    config["rabbitmq_port"], config["rabbitmq_host"])
+        router = make_router(config)
+        scorer = make_scorer(config["inference_mode"], config["ml_batch_url"], config["inference_workers"])
+        consumer.consume_batches(config["queue_name"], make_batch_handler(mongo, scorer, router),
+                                 router, batch_size=config["batch_size"], max_wait_ms=config["batch_max_wait_ms"],
+                                 prefetch_count=config["prefetch_count"])
 
-    mongo = MongoLogger(uri=os.getenv("MONGODB_URI", "mongodb://mongo:27017"),
-                        db_name="redditPosts",
-                        collection="posts")
+def supervise(config: dict, workers: int) -> None:
+    """
+    Run `workers` consumer processes, restart any that exit (with capped
+    exponential backoff) and print their combined counters.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    stats_queue = ctx.Queue()
+    procs: dict[int, multiprocessing.Process] = {}
+    restarts: Counter[int] = Counter()
+    restart_at: dict[int, float] = {}
+    started_at: dict[int, float] = {}
+    latest: dict[int, dict] = {}
+    retired: Counter[str] = Counter()   # 已退出 worker 的累计值，避免重启后总数回退
 
-    consumer = RabbitMQConsumer(rabbitmq_user, rabbitmq_password, rabbitmq_port, rabbitmq_host)
-    consumer.consume(rabbitmq_queue_name, make_callback(mongo, ml_url))
+    def start(worker_id: int) -> None:
+        proc = ctx.Process(target=run_worker, args=(config, worker_id, stats_queue), name=f"consumer-{worker_id}")
+        proc.start()
+        procs[worker_id] = proc
+        started_at[worker_id] = time.monotonic()
+
+    for worker_id in range(workers):
+        start(worker_id)
+    print(f"supervisor started {workers} workers")
+
+    last_report = time.monotonic()
+    try:
+        while True:
+            try:
+                while True:
+                    worker_id, snapshot = stats_queue.get(timeout=1)
+                    latest[worker_id] = snapshot
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            for worker_id, proc in procs.items():
+                if proc.is_alive() or worker_id in restart_at:
+                    continue
+                retired.update(latest.pop(worker_id, {}))
+                # 稳定跑过一阵的 worker 重新从最短退避开始
+                if now - started_at[worker_id] > 300:
+                    restarts[worker_id] = 0
+                restarts[worker_id] += 1
+                delay = min(60, 2 ** restarts[worker_id])
+                print(f"worker {worker_id} exited with {proc.exitcode}, restarting in {delay}s")
+                restart_at[worker_id] = now + delay
+            for worker_id, when in list(restart_at.items()):
+                if now >= when:
+                    del restart_at[worker_id]
+                    start(worker_id)
+
+            if now - last_report >= config["stats_interval"]:
+                last_report = now
+                total = Counter(retired)
+                for snapshot in latest.values():
+                    total.update(snapshot)
+                alive = sum(proc.is_alive() for proc in procs.values())
+                print(f"supervisor: {alive}/{workers} workers alive, restarts={sum(restarts.values())}, totals={dict(total)}")
+    finally:
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            proc.join(timeout=10)
+
+def replay_dead_letters(config: dict, limit: int | None = None) -> None:
+    consumer = RabbitMQConsumer(config["rabbitmq_user"], config["rabbitmq_password"],
+                                config["rabbitmq_port"], config["rabbitmq_host"])
+    replayed = consumer.replay_dead_letters(make_router(config), limit=limit)
+    print(f"replayed {replayed} messages from {config['queue_name']}.dlq")
+
+def backfill_sentiment(config: dict, batch_size: int = 1000) -> None:
+    mongo = MongoLogger(uri=config["mongo_uri"])
+    updated = mongo.backfill_sentiment_fields(batch_size)
+    print(f"backfill done: {updated} documents updated")
+
+def remove_duplicates(config: dict) -> None:
+    # 先清重复，再建唯一索引；不能在 worker 启动时悄悄做
+    mongo = MongoLogger(uri=config["mongo_uri"], create_indexes=False)
+    removed = mongo.remove_duplicates()
+    print(f"removed {removed} duplicate posts")
+    mongo.ensure_indexes()
+    print("unique id index is in place")
+
+def rebuild_rollups(config: dict) -> None:
+    mongo = MongoLogger(uri=config["mongo_uri"], rollup_bucket_seconds=config["rollup_bucket_seconds"] or 60)
+    buckets = mongo.rebuild_rollups()
+    print(f"rebuilt {buckets} rollup buckets of {mongo.rollup_bucket_seconds}s")
+
+if __name__ == "__main__":
+    config = load_config()
+    if sys.argv[1:2] == ["replay-dlq"]:
+        # python main.py replay-dlq [limit]
+        replay_dead_letters(config, int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    elif sys.argv[1:2] == ["backfill-sentiment"]:
+        # python main.py backfill-sentiment [batch_size]
+        backfill_sentiment(config, int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    elif sys.argv[1:2] == ["remove-duplicates"]:
+        # 老数据里有重复 id 时 worker 会拒绝启动，先跑这个
+        remove_duplicates(config)
+    elif sys.argv[1:2] == ["rebuild-rollups"]:
+        # 先跑 backfill-sentiment，rollup 依赖写入时的标签字段
+        rebuild_rollups(config)
+    elif config["workers"] > 1 or "supervise" in sys.argv[1:]:
+        supervise(config, config["workers"])
+    else:
+        run_worker(config)
@@ -1,6 +1,7 @@
 import praw
 import datetime
 import json
+import gzip
 from dotenv import load_dotenv
 import os
 from typing import Generator
@@ -9,12 +10,57 @@ from dataclasses import dataclass, asdict
 import pika
 import time
 import random
+import math
+import threading
+from collections import Counter, OrderedDict
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s %(levelname)s [%(funcName)s] %(message)s'
 )
 
+# 消息格式版本，放在 AMQP header 里，消费端据此解码
+MESSAGE_SCHEMA_VERSION = 1
+
+def encode_message(payload: dict, fmt: str = "msgpack", compression: str = "zstd",
+                   compress_min_bytes: int = 1024) -> tuple[bytes, pika.BasicProperties]:
+    """
+    Serialise a post for the wire. The format and any compression are declared
+    in `content_type` / `content_encoding`; consumers fall back to plain JSON
+    when neither is set, so old and new messages can share a queue.
+    """
+    if fmt == "msgpack" and msgpack is not None:
+        body, content_type = msgpack.packb(payload, use_bin_type=True), "application/msgpack"
+    else:
+        body, content_type = json.dumps(payload, separators=(",", ":")).encode("utf-8"), "application/json"
+
+    content_encoding = None
+    if len(body) >= compress_min_bytes:
+        if compression == "zstd" and zstandard is not None:
+            body, content_encoding = zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+        elif compression in ("zstd", "gzip"):
+            body, content_encoding = gzip.compress(body, compresslevel=6), "gzip"
+
+    return body, pika.BasicProperties(
+        delivery_mode=2,
+        content_type=content_type,
+        content_encoding=content_encoding,
+        headers={"x-schema-version": MESSAGE_SCHEMA_VERSION},
+    )
+
 @dataclass()
 class RedditPost:
     title: str
@@ -23,20 +69,33 @@ class RedditPost:
     created_utc: float
     selftext: str
     now_time: float
+    subreddit: str = ""
+
+def parse_subreddits(value: str) -> list[str]:
+    """`SUB_REDDIT` may list several subreddits, separated by `,` or `+`."""
+    return [name.strip() for name in value.replace("+", ",").split(",") if name.strip()]
 
 class RedditFetcher:
-    def __init__(self, client_id:str, client_secret:str, user_agent:str, subreddit:str):
+    """
+    Streams every configured subreddit through one combined `a+b+c` listing,
+    so a single PRAW session covers all of them. Each post carries the
+    configured subreddit name, which is also its queue name.
+    """
+    def __init__(self, client_id:str, client_secret:str, user_agent:str, subreddits:list[str]):
         self.reddit = praw.Reddit(
             client_id = client_id,
             client_secret = client_secret,
             user_agent = user_agent
         )
-        self.subreddit = subreddit
+        self.subreddits = subreddits
+        # Reddit 返回的 display_name 大小写可能和配置不同
+        self._queue_for = {name.lower(): name for name in subreddits}
 
 
     def fetch_data(self)->Generator[RedditPost, None, None]:
-        subreddit = self.reddit.subreddit(self.subreddit)
+        subreddit = self.reddit.subreddit("+".join(self.subreddits))
         for submission in subreddit.stream.submissions(skip_existing = True):
+            name = submission.subreddit.display_name
             yield RedditPost(
                 title=submission.title,
                 id=submission.id,
@@ -44,94 +103,603 @@ class RedditFetcher:
                 created_utc=submission.created_utc,
                 selftext=submission.selftext,
                 now_time=datetime.datetime.now().timestamp(),
+                subreddit=self._queue_for.get(name.lower(), name),
             )
 
+@dataclass
+class SimulationConfig:
+    """Knobs for the synthetic load generator (see MockRedditFetcher)."""
+    rate: float = 10.0                 # target msgs/sec (long-run mean)
+    arrival: str = "poisson"           # constant | poisson | bursty
+    burst_factor: float = 10.0         # bursty: rate multiplier while a burst is on
+    burst_seconds: float = 5.0         # bursty: length of each burst
+    text_median_words: int = 40        # selftext length is lognormal around this
+    text_sigma: float = 1.0
+    empty_text_ratio: float = 0.3      # link posts without a selftext
+    duplicate_ratio: float = 0.0       # re-emit an already generated post id
+    subreddit_skew: float = 1.0        # Zipf exponent of the subreddit mix, 0 = uniform
+    seed: int | None = None
+
 class MockRedditFetcher:
-    """Simulates fetching Reddit posts without hitting Reddit's API."""
-    def __init__(self, client_id: str, client_secret: str, user_agent: str, subreddit: str):
-        self.subreddit = subreddit
+    """
+    Synthetic load generator that never touches Reddit's API.
+
+    Arrivals are open-loop: post times are drawn up front from the configured
+    arrival process, and the generator only sleeps when it is ahead of that
+    schedule, so a slow downstream does not lower the offered load.
+    """
+    base_titles: list[str] = [
+        "This community is amazing!",
+        "This is so disappointing.",
+        "What an incredible achievement!",
+        "Why does this keep happening?",
+        "I love how helpful everyone is here.",
+        "I can't believe how bad this is."
+    ]
+
+    selftexts: list[str] = [
+        "I'm feeling so inspired after reading these comments.",
+        "I'm frustrated with the lack of progress.",
+        "This made my day!",
+        "This situation is really discouraging.",
+        "The advice here has really helped me grow.",
+        "I feel let down by the outcome."
+    ]
+
+    def __init__(self, client_id: str, client_secret: str, user_agent: str, subreddits: list[str],
+                 config: SimulationConfig | None = None):
+        self.subreddits = subreddits
+        self.config = config or SimulationConfig()
+        self.rng = random.Random(self.config.seed)
+        self.vocabulary = " ".join(self.base_titles + self.selftexts).split()
+        self.subreddit_weights = [1 / (rank ** self.config.subreddit_skew) for rank in range(1, len(subreddits) + 1)]
+
+    def _interarrivals(self) -> Generator[float, None, None]:
+        cfg = self.config
+        if cfg.arrival == "constant":
+            while True:
+                yield 1 / cfg.rate
+        elif cfg.arrival == "bursty":
+            # 开 burst_seconds，关 burst_seconds * (factor - 1)，长期均值仍是 rate
+            burst_rate = cfg.rate * cfg.burst_factor
+            off_seconds = cfg.burst_seconds * (cfg.burst_factor - 1)
+            gap = off_seconds
+            while True:
+                elapsed = 0.0
+                while True:
+                    step = self.rng.expovariate(burst_rate)
+                    if elapsed + step > cfg.burst_seconds:
+                        break
+                    elapsed += step
+                    yield gap + step
+                    gap = 0.0
+                # 没有到达的窗口，未消费的间隔要带到下一个窗口，否则节奏会越跑越快
+                gap += cfg.burst_seconds - elapsed + off_seconds
+        else:
+            while True:
+                yield self.rng.expovariate(cfg.rate)
+
+    def _selftext(self) -> str:
+        cfg = self.config
+        if self.rng.random() < cfg.empty_text_ratio:
+            return ""
+        words = int(self.rng.lognormvariate(math.log(cfg.text_median_words), cfg.text_sigma))
+        return " ".join(self.rng.choices(self.vocabulary, k=max(1, min(words, 5000))))
 
     def fetch_data(self) -> Generator["RedditPost", None, None]:
         i: int = 0
-        base_titles: list[str] = [
-            "This community is amazing!",
-            "This is so disappointing.",
-            "What an incredible achievement!",
-            "Why does this keep happening?",
-            "I love how helpful everyone is here.",
-            "I can't believe how bad this is."
-        ]
-
-        selftexts: list[str] = [
-            "I'm feeling so inspired after reading these comments.",
-            "I'm frustrated with the lack of progress.",
-            "This made my day!",
-            "This situation is really discouraging.",
-            "The advice here has really helped me grow.",
-            "I feel let down by the outcome."
-        ]
-
-        while True:
+        next_at = time.monotonic()
+        for gap in self._interarrivals():
+            next_at += gap
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            if i and self.rng.random() < self.config.duplicate_ratio:
+                post_index = self.rng.randrange(i)
+            else:
+                post_index = i
+                i += 1
+
             yield RedditPost(
-                title=f"{random.choice(base_titles)} - {i}",
-                id=f"id_{i}",
-                url=f"http://example.com/{i}",
+                title=f"{self.rng.choice(self.base_titles)} - {post_index}",
+                id=f"id_{post_index}",
+                url=f"http://example.com/{post_index}",
                 created_utc=datetime.datetime.now().timestamp(),
-                selftext=random.choice(selftexts),
+                selftext=self._selftext(),
                 now_time=datetime.datetime.now().timestamp(),
+                subreddit=self.rng.choices(self.subreddits, weights=self.subreddit_weights)[0],
             )
-            i += 1
+
+class PublishMetrics:
+    """Running totals for publish latency (buffered -> sent) and confirm lag (sent -> acked)."""
+    def __init__(self):
+        self.published = 0
+        self.confirmed = 0
+        self.nacked = 0
+        self.republished = 0
+        self.publish_latency_total = 0.0
+        self.publish_latency_max = 0.0
+        self.confirm_lag_total = 0.0
+        self.confirm_lag_max = 0.0
+        self.confirmed_per_queue: Counter[str] = Counter()
+        self.started = time.time()
+
+    def observe_publish(self, latency: float) -> None:
+        self.published += 1
+        self.publish_latency_total += latency
+        self.publish_latency_max = max(self.publish_latency_max, latency)
+
+    def observe_confirm(self, queue_name: str, lag: float) -> None:
+        self.confirmed += 1
+        self.confirmed_per_queue[queue_name] += 1
+        self.confirm_lag_total += lag
+        self.confirm_lag_max = max(self.confirm_lag_max, lag)
+
+    def snapshot(self, unconfirmed: int) -> dict:
+        return {
+            "published": self.published,
+            "confirmed": self.confirmed,
+            "nacked": self.nacked,
+            "republished": self.republished,
+            "unconfirmed": unconfirmed,
+            "publish_latency_avg_ms": round(1000 * self.publish_latency_total / max(self.published, 1), 2),
+            "publish_latency_max_ms": round(1000 * self.publish_latency_max, 2),
+            "confirm_lag_avg_ms": round(1000 * self.confirm_lag_total / max(self.confirmed, 1), 2),
+            "confirm_lag_max_ms": round(1000 * self.confirm_lag_max, 2),
+        }
+
+    def queue_rates(self) -> dict[str, float]:
+        """Confirmed messages per second for each queue since start."""
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {name: round(count / elapsed, 3) for name, count in sorted(self.confirmed_per_queue.items())}
+
+@dataclass
+class PendingMessage:
+    queue_name: str
+    body: bytes | str
+    properties: pika.BasicProperties | None
+    enqueued_at: float
+    published_at: float = 0.0
+    key: str | None = None
 
 class RabbitMQPublisher:
-    def __init__(self, username: str, password:str, port: int, host: str):
+    """
+    Publishes over a SelectConnection driven by a background I/O thread.
+
+    Messages are buffered and sent as a batch once `batch_size` are waiting or
+    every `flush_interval_ms`. The channel runs in confirm mode: a message is
+    only durable once the broker acks it, and anything unconfirmed (or nacked)
+    when the connection drops is republished after reconnecting. `on_confirm`
+    is called on the I/O thread with the `key` of every acked message.
+    """
+    def __init__(self, username: str, password:str, port: int, host: str,
+                 batch_size: int = 100, flush_interval_ms: int = 200, reconnect_delay: float = 5.0,
+                 on_confirm=None):
         self.credentials = pika.PlainCredentials(username=username, password=password)
         self.parameters = pika.ConnectionParameters(host = host, port = port, credentials=self.credentials)
-        self.connection = pika.BlockingConnection(parameters=self.parameters)
-        self.channel = self.connection.channel()
-    
-    def publish(self, queue_name:str, message: str) -> None:
-        self.channel.queue_declare(queue=queue_name, durable=True)
-        self.channel.basic_publish(exchange='',
-                                   routing_key=queue_name,
-                                   body=message,
-                                   properties=pika.BasicProperties(
-                                       delivery_mode=2,
-                                   ))
-    
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.reconnect_delay = reconnect_delay
+        self.on_confirm = on_confirm
+        self.metrics = PublishMetrics()
+
+        self._cond = threading.Condition()
+        self._buffer: list[PendingMessage] = []
+        self._unconfirmed: dict[int, PendingMessage] = {}
+        self._declared: set[str] = set()
+        self._next_tag = 0
+        self._connection = None
+        self._channel = None
+        self._closing = False
+        self._ready = threading.Event()
+
+        self._thread = threading.Thread(target=self._run, name="rabbitmq-io", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout=30):
+            raise ConnectionError(f"Could not connect to RabbitMQ at {host}:{port}")
+
+    # --- called from the producer thread ---
+
+    def publish(self, queue_name:str, message: bytes | str, properties: pika.BasicProperties | None = None,
+                key: str | None = None) -> None:
+        with self._cond:
+            self._buffer.append(PendingMessage(queue_name, message, properties, time.time(), key=key))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._schedule_flush()
+
+    def wait_for_confirms(self, timeout: float = 30.0) -> bool:
+        """Block until every buffered message has been confirmed by the broker."""
+        self._schedule_flush()
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._buffer and not self._unconfirmed, timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return self.metrics.snapshot(len(self._unconfirmed))
+
+    def queue_depth(self, queue_name: str, timeout: float = 5.0) -> int | None:
+        """
+        Ready-message count of `queue_name`. Uses an idempotent (same-arguments)
+        declare rather than passive=True, which would close the channel if the
+        queue does not exist yet.
+        """
+        connection = self._connection
+        if connection is None:
+            return None
+        result: dict[str, int] = {}
+        done = threading.Event()
+
+        def on_declare_ok(frame) -> None:
+            result["depth"] = frame.method.message_count
+            done.set()
+
+        def declare() -> None:
+            if self._channel is None:
+                done.set()
+                return
+            self._channel.queue_declare(queue=queue_name, durable=True, callback=on_declare_ok)
+            self._declared.add(queue_name)
+
+        connection.ioloop.add_callback_threadsafe(declare)
+        done.wait(timeout)
+        return result.get("depth")
+
+    def queue_rates(self) -> dict[str, float]:
+        with self._cond:
+            return self.metrics.queue_rates()
+
+    def close(self) -> None:
+        self.wait_for_confirms()
+        self._closing = True
+        if self._connection is not None:
+            self._connection.ioloop.add_callback_threadsafe(self._connection.close)
+        self._thread.join(timeout=10)
+
+    def _schedule_flush(self) -> None:
+        connection = self._connection
+        if connection is not None:
+            connection.ioloop.add_callback_threadsafe(self._flush)
+
+    # --- I/O thread ---
+
+    def _run(self) -> None:
+        while not self._closing:
+            self._connection = pika.SelectConnection(
+                parameters=self.parameters,
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_error,
+                on_close_callback=self._on_connection_error,
+            )
+            self._connection.ioloop.start()
+            if not self._closing:
+                logging.warning(f"RabbitMQ connection lost, reconnecting in {self.reconnect_delay}s")
+                time.sleep(self.reconnect_delay)
+
+    def _on_connection_open(self, connection) -> None:
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error) -> None:
+        logging.warning(f"RabbitMQ connection closed: {error!r}")
+        with self._cond:
+            self._channel = None
+            # 未确认的消息放回缓冲区头部，重连后重发
+            requeued = [self._unconfirmed[tag] for tag in sorted(self._unconfirmed)]
+            self.metrics.republished += len(requeued)
+            self._buffer[:0] = requeued
+            self._unconfirmed.clear()
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel) -> None:
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.confirm_delivery(
+            ack_nack_callback=self._on_delivery_confirmation,
+            callback=lambda frame: self._on_confirm_mode(channel),
+        )
+
+    def _on_channel_closed(self, channel, reason) -> None:
+        logging.warning(f"RabbitMQ channel closed: {reason!r}")
+        if not (self._connection.is_closing or self._connection.is_closed):
+            self._connection.close()
+
+    def _on_confirm_mode(self, channel) -> None:
+        self._channel = channel
+        self._next_tag = 0
+        self._declared.clear()
+        self._ready.set()
+        self._flush()
+        self._tick()
+
+    def _tick(self) -> None:
+        if self._channel is None:
+            return
+        self._flush()
+        self._connection.ioloop.call_later(self.flush_interval, self._tick)
+
+    def _flush(self) -> None:
+        if self._channel is None:
+            return
+        with self._cond:
+            batch, self._buffer = self._buffer, []
+        now = time.time()
+        for msg in batch:
+            # 每个队列只声明一次
+            if msg.queue_name not in self._declared:
+                self._channel.queue_declare(queue=msg.queue_name, durable=True)
+                self._declared.add(msg.queue_name)
+            self._channel.basic_publish(exchange='',
+                                        routing_key=msg.queue_name,
+                                        body=msg.body,
+                                        properties=msg.properties or pika.BasicProperties(
+                                            delivery_mode=2,
+                                        ))
+            self._next_tag += 1
+            msg.published_at = now
+            with self._cond:
+                self._unconfirmed[self._next_tag] = msg
+                self.metrics.observe_publish(now - msg.enqueued_at)
+
+    def _on_delivery_confirmation(self, frame) -> None:
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        now = time.time()
+        confirmed = []
+        with self._cond:
+            if method.multiple:
+                tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+            else:
+                tags = [method.delivery_tag]
+            for tag in tags:
+                msg = self._unconfirmed.pop(tag, None)
+                if msg is None:
+                    continue
+                if acked:
+                    self.metrics.observe_confirm(msg.queue_name, now - msg.published_at)
+                    if msg.key is not None:
+                        confirmed.append(msg.key)
+                else:
+                    self.metrics.nacked += 1
+                    self._buffer.append(msg)
+            self._cond.notify_all()
+        if self.on_confirm is not None:
+            for key in confirmed:
+                self.on_confirm(key)
+
+class PublishedIdFilter:
+    """
+    Bounded LRU set of post ids the broker has confirmed, snapshotted to `path`
+    so it survives restarts. `seen` only marks a new id as in flight; it is
+    recorded once the publisher calls `confirm` from its ack callback, so ids
+    that never reached the broker are neither kept nor written out. Producers
+    sharing the file (e.g. on a common volume) pick up each other's ids at
+    startup; `snapshot` merges with the file under a lock instead of
+    overwriting it.
+    """
+    def __init__(self, path: str, capacity: int = 100_000, snapshot_every: int = 500):
+        self.path = path
+        self.capacity = capacity
+        self.snapshot_every = snapshot_every
+        self.suppressed = 0
+        self._lock = threading.Lock()
+        self._in_flight: set[str] = set()
+        self._dirty = 0
+        self._ids = self._read()
+        if self._ids:
+            logging.info(f"loaded {len(self._ids)} published ids from {path}")
+
+    def _read(self) -> OrderedDict[str, None]:
+        ids: OrderedDict[str, None] = OrderedDict()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    post_id = line.strip()
+                    if post_id:
+                        ids[post_id] = None
+                        ids.move_to_end(post_id)
+        while len(ids) > self.capacity:
+            ids.popitem(last=False)
+        return ids
+
+    def seen(self, post_id: str) -> bool:
+        """True if `post_id` was published or is awaiting its confirm; otherwise mark it in flight."""
+        with self._lock:
+            if post_id in self._ids:
+                self._ids.move_to_end(post_id)
+                self.suppressed += 1
+                return True
+            if post_id in self._in_flight:
+                self.suppressed += 1
+                return True
+            self._in_flight.add(post_id)
+            snapshot_due = self._dirty >= self.snapshot_every
+        # 在生产者线程落盘，不占 I/O 线程
+        if snapshot_due:
+            self.snapshot()
+        return False
+
+    def confirm(self, post_id: str) -> None:
+        """Record `post_id` as published; called on the publisher's I/O thread when the broker acks it."""
+        with self._lock:
+            self._in_flight.discard(post_id)
+            self._ids[post_id] = None
+            self._ids.move_to_end(post_id)
+            if len(self._ids) > self.capacity:
+                self._ids.popitem(last=False)
+            self._dirty += 1
+
+    def snapshot(self) -> None:
+        """Write the confirmed ids to `path`, merged with whatever other producers wrote there."""
+        with open(f"{self.path}.lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # 先读盘上的（可能有别的生产者写的），本进程的 id 排在后面，按 LRU 截断时优先保留
+            merged = self._read()
+            with self._lock:
+                ids = list(self._ids)
+                self._dirty = 0
+            for post_id in ids:
+                merged[post_id] = None
+                merged.move_to_end(post_id)
+            while len(merged) > self.capacity:
+                merged.popitem(last=False)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.writelines(f"{post_id}\n" for post_id in merged)
+            os.replace(tmp, self.path)
+
+class AdaptiveRateController:
+    """
+    Token bucket whose refill rate follows the consumer backlog.
+
+    At or below `low_watermark` ready messages the producer may publish at
+    `max_rate`; the rate falls linearly to `min_rate` as the backlog grows to
+    `high_watermark`. The backlog is re-read every `check_interval` seconds.
+    """
+    def __init__(self, depth_fn, max_rate: float, min_rate: float,
+                 low_watermark: int, high_watermark: int, check_interval: float = 5.0):
+        # acquire() 按 1/rate 睡眠，rate 不能为 0
+        if not 0 < min_rate <= max_rate:
+            raise ValueError(f"publish rates must satisfy 0 < MIN_PUBLISH_RATE <= MAX_PUBLISH_RATE, "
+                             f"got min={min_rate}, max={max_rate}")
+        self.depth_fn = depth_fn
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark + 1)
+        self.check_interval = check_interval
+        self.rate = max_rate
+        self.depth: int | None = None
+        self._tokens = max_rate
+        self._last_refill = time.monotonic()
+        self._last_check = 0.0
+
+    def _rate_for(self, depth: int | None) -> float:
+        if depth is None or depth <= self.low_watermark:
+            return self.max_rate
+        if depth >= self.high_watermark:
+            return self.min_rate
+        fraction = (depth - self.low_watermark) / (self.high_watermark - self.low_watermark)
+        return self.max_rate - fraction * (self.max_rate - self.min_rate)
+
+    def acquire(self) -> None:
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self.depth = self.depth_fn()
+            rate = self._rate_for(self.depth)
+            if rate != self.rate:
+                logging.info(f"backlog={self.depth}, publish rate {self.rate:.2f} -> {rate:.2f} msg/s")
+            self.rate = rate
+
+        # 桶容量 = 一秒的量，空闲后允许小幅突发
+        capacity = max(1.0, self.rate)
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        if self._tokens < 1:
+            time.sleep((1 - self._tokens) / self.rate)
+            self._tokens = 1
+            self._last_refill = time.monotonic()
+        self._tokens -= 1
+
 if __name__ == '__main__':
     load_dotenv()
     reddit_client_id: str = os.getenv('REDDIT_CLIENT_ID')
     reddit_client_secret: str = os.getenv('REDDIT_CLIENT_SECRET')
     reddit_user_agent: str = os.getenv('REDDIT_USER_AGENT')
-    subreddit: str = os.getenv('SUB_REDDIT')
+    subreddits: list[str] = parse_subreddits(os.getenv('SUB_REDDIT', ''))
 
     rabbitmq_user: str = os.getenv('RABBITMQ_USER')
     rabbitmq_password: str = os.getenv('RABBITMQ_PASSWORD')
     rabbitmq_host: str = os.getenv('RABBITMQ_HOST')
     rabbitmq_port: int = int(os.getenv('RABBITMQ_PORT'))
-    simulation_mode: bool = os.getenv('SIMULATION_MODE')
+    simulation_mode: bool = os.getenv('SIMULATION_MODE', 'false').lower() in ('1', 'true', 'yes')
+    publish_batch_size: int = int(os.getenv('PUBLISH_BATCH_SIZE', '100'))
+    publish_flush_ms: int = int(os.getenv('PUBLISH_FLUSH_MS', '200'))
+    message_format: str = os.getenv('MESSAGE_FORMAT', 'msgpack')
+    message_compression: str = os.getenv('MESSAGE_COMPRESSION', 'zstd')
+    compress_min_bytes: int = int(os.getenv('MESSAGE_COMPRESS_MIN_BYTES', '1024'))
+    max_publish_rate: float = float(os.getenv('MAX_PUBLISH_RATE', '50'))
+    min_publish_rate: float = float(os.getenv('MIN_PUBLISH_RATE', '0.5'))
+    backlog_low: int = int(os.getenv('BACKLOG_LOW_WATERMARK', '1000'))
+    backlog_high: int = int(os.getenv('BACKLOG_HIGH_WATERMARK', '10000'))
+    dedupe_path: str = os.getenv('DEDUPE_PATH', 'published_ids.txt')
+    dedupe_capacity: int = int(os.getenv('DEDUPE_CAPACITY', '100000'))
 
-    if simulation_mode==True:
+    if simulation_mode:
+        seed = os.getenv('SIM_SEED')
+        simulation_config = SimulationConfig(
+            rate=float(os.getenv('SIM_RATE', '10')),
+            arrival=os.getenv('SIM_ARRIVAL', 'poisson'),
+            burst_factor=float(os.getenv('SIM_BURST_FACTOR', '10')),
+            burst_seconds=float(os.getenv('SIM_BURST_SECONDS', '5')),
+            text_median_words=int(os.getenv('SIM_TEXT_MEDIAN_WORDS', '40')),
+            empty_text_ratio=float(os.getenv('SIM_EMPTY_TEXT_RATIO', '0.3')),
+            duplicate_ratio=float(os.getenv('SIM_DUPLICATE_RATIO', '0')),
+            subreddit_skew=float(os.getenv('SIM_SUBREDDIT_SKEW', '1')),
+            seed=int(seed) if seed else None,
+        )
         reddit_fetcher = MockRedditFetcher(
             reddit_client_id, 
             reddit_client_secret, 
             reddit_user_agent,
-            subreddit,
+            subreddits,
+            simulation_config,
             )
     else:
         reddit_fetcher = RedditFetcher(
             reddit_client_id, 
             reddit_client_secret, 
             reddit_user_agent,
-            subreddit,
+            subreddits,
             )
 
-    
+    # 模拟数据的 id 每次运行都从 id_0 重新编号，SIM_DUPLICATE_RATIO 又是故意发重复给消费端，所以不去重
+    published_ids = None if simulation_mode else PublishedIdFilter(dedupe_path, dedupe_capacity)
+
     rabbitmq_publisher = RabbitMQPublisher(
-        rabbitmq_user, rabbitmq_password, rabbitmq_port, rabbitmq_host
+        rabbitmq_user, rabbitmq_password, rabbitmq_port, rabbitmq_host,
+        batch_size=publish_batch_size,
+        flush_interval_ms=publish_flush_ms,
+        on_confirm=published_ids.confirm if published_ids else None,
+    )
+
+    def max_backlog() -> int | None:
+        # 按最堵的那个队列来限速
+        depths = [d for d in (rabbitmq_publisher.queue_depth(name) for name in subreddits) if d is not None]
+        return max(depths) if depths else None
+
+    # 模拟模式是开环压测：按 SIM_RATE 的到达过程发，不受 MAX_PUBLISH_RATE / 积压回退限制
+    rate_controller = None if simulation_mode else AdaptiveRateController(
+        max_backlog,
+        max_rate=max_publish_rate,
+        min_rate=min_publish_rate,
+        low_watermark=backlog_low,
+        high_watermark=backlog_high,
     )
 
-    for post in reddit_fetcher.fetch_data():
-        rabbitmq_publisher.publish(subreddit, json.dumps(asdict(post)))
-        logging.info(json.dumps(asdict(post)))
-        time.sleep(2)
+    try:
+        for n, post in enumerate(reddit_fetcher.fetch_data(), start=1):
+            if published_ids and published_ids.seen(post.id):
+                logging.debug(f"skipping already published post {post.id}")
+                continue
+            if rate_controller:
+                rate_controller.acquire()
+            payload = asdict(post)
+            body, properties = encode_message(payload, message_format, message_compression, compress_min_bytes)
+            rabbitmq_publisher.publish(post.subreddit, body, properties, key=post.id)
+            if not simulation_mode:
+                # 压测时逐条序列化长 selftext 的开销会成为瓶颈，只看下面的汇总统计
+                logging.info(json.dumps(payload))
+            if n % 100 == 0:
+                backlog = rate_controller.depth if rate_controller else None
+                logging.info(f"publisher stats: {rabbitmq_publisher.stats()}, backlog={backlog}, "
+                             f"duplicates_suppressed={published_ids.suppressed if published_ids else 0}")
+                logging.info(f"per-subreddit msg/s: {rabbitmq_publisher.queue_rates()}")
+    finally:
+        try:
+            # close() 等到所有确认回来，之后再落盘才包含最后一批
+            rabbitmq_publisher.close()
+        finally:
+            if published_ids:
+                published_ids.snapshot()
@@ -2,6 +2,8 @@ import time
 import requests
 import random
 import urllib3
+from requests.adapters import HTTPAdapter
+from .instrumentation import stage, timed
 from .logger_config import setup_logger
 
 # 禁用安全警告（因为我们要关闭 SSL 验证）
@@ -9,6 +11,10 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 logger = setup_logger()
 
+# 复用连接池：常驻进程里每次请求不再重新握手
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=8))
+
 # === 🛡️ 终极备用镜像池 ===
 # 混合了官方旧版接口 (old.reddit) 和 镜像站
 MIRRORS = [
@@ -19,6 +25,7 @@ MIRRORS = [
     'https://libreddit.bus-hit.me',
 ]
 
+@timed("fetch_json")
 def fetch_json(path):
     headers = {
         # 伪装成 Google 爬虫或者非常普通的浏览器
@@ -41,7 +48,9 @@ def fetch_json(path):
             timeout = 10 if 'reddit.com' in mirror else 5
             
             # 🔥 核心修改：verify=False (忽略 SSL 证书错误)
-            resp = requests.get(url, headers=headers, timeout=timeout, verify=False)
+            with stage("fetch_json.request", items=1) as span:
+                resp = session.get(url, headers=headers, timeout=timeout, verify=False)
+                span.bytes = len(resp.content)
             
             if resp.status_code == 200:
                 try:
@@ -51,7 +60,8 @@ def fetch_json(path):
                 except:
                     pass
             elif resp.status_code == 429:
-                time.sleep(2) # 被限流了，歇会儿
+                with stage("fetch_json.backoff"):
+                    time.sleep(2) # 被限流了，歇会儿
             else:
                 # 打印具体错误码，方便调试
                 logger.warning(f"⚠️ {mirror} returned {resp.status_code}")
@@ -77,6 +87,52 @@ def get_top_comments_text(post_id):
         except: pass
     return " | ".join(comments_list)
 
+def _to_post(p, subreddit_name):
+    return {
+        "title": p.get('title'),
+        "id": p.get('id'),
+        "url": f"https://www.reddit.com{p.get('permalink')}",
+        "score": p.get('score', 0),
+        "upvote_ratio": p.get('upvote_ratio', 1.0),
+        "num_comments": p.get('num_comments', 0),
+        "created_utc": p.get('created_utc'),
+        "subreddit": subreddit_name,
+        "selftext": f"{p.get('title')} . {p.get('selftext', '')[:200]}",
+        "comments": []
+    }
+
+def iter_post_pages(subreddit_name, post_limit=10, posts_to_get="Hot", page_size=100):
+    """
+    Yield the listing one page at a time, following Reddit's `after` cursor,
+    so callers can start processing a page while the next one is fetched.
+    """
+    fetched = 0
+    after = None
+    while fetched < post_limit:
+        limit = min(page_size, post_limit - fetched)
+        list_path = f"/r/{subreddit_name}/{posts_to_get.lower()}.json?limit={limit}"
+        if after:
+            list_path += f"&after={after}"
+        list_data = fetch_json(list_path)
+        if not (list_data and isinstance(list_data, dict) and 'data' in list_data):
+            return
+
+        page = []
+        for child in list_data['data'].get('children', []):
+            try:
+                page.append(_to_post(child['data'], subreddit_name))
+            except: continue
+        if not page:
+            return
+
+        page = page[:post_limit - fetched]
+        fetched += len(page)
+        yield page
+
+        after = list_data['data'].get('after')
+        if not after:
+            return
+
 def get_post_data(subreddit_name, post_limit=10, comment_limmit=5, reddit=None, posts_to_get="Hot"):
     logger.info(f"🚀 [Serv00] Fetching r/{subreddit_name}...")
     
@@ -97,18 +153,7 @@ def get_post_data(subreddit_name, post_limit=10, comment_limmit=5, reddit=None,
                 # comments = get_top_comments_text(p['id'])
                 comments = ""
                 
-                cleaned_posts.append({
-                    "title": p.get('title'),
-                    "id": p.get('id'),
-                    "url": f"https://www.reddit.com{p.get('permalink')}",
-                    "score": p.get('score', 0),
-                    "upvote_ratio": p.get('upvote_ratio', 1.0),
-                    "num_comments": p.get('num_comments', 0),
-                    "created_utc": p.get('created_utc'),
-                    "subreddit": subreddit_name,
-                    "selftext": f"{p.get('title')} . {p.get('selftext', '')[:200]}",
-                    "comments": []
-                })
+                cleaned_posts.append(_to_post(p, subreddit_name))
             except: continue
                 
     return cleaned_posts
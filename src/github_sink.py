@@ -0,0 +1,151 @@
+import base64
+import gzip
+import itertools
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone, timedelta
+
+import requests
+
+from .instrumentation import stage
+from .logger_config import setup_logger
+
+logger = setup_logger()
+
+# 可以指向本地 stub 服务来代替 GitHub
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+
+RETRY_STATUSES = {409, 422, 429, 500, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def to_ndjson_gz(payload):
+    """
+    Compact gzip'd NDJSON: one line per subreddit record, each carrying the
+    run timestamp.
+    """
+    lines = [
+        json.dumps({"timestamp": payload.get("timestamp"), **record},
+                   ensure_ascii=False, separators=(",", ":"), default=str)
+        for record in payload.get("data", [])
+    ]
+    return gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+class GitHubBatchSink:
+    """
+    Buffers run payloads in a local spool directory and commits all of them
+    in a single commit through the Git Data API (blobs -> tree -> commit ->
+    ref). Spooled files are only removed once the commit has landed, so a
+    failed upload is retried on the next flush instead of being lost.
+    """
+    def __init__(self, repo, token, output_root, spool_dir=".sync_spool",
+                 branch="main", batch_size=1, max_retries=5, base_delay=1.0,
+                 api_url=GITHUB_API_URL):
+        self.repo = repo
+        self.output_root = output_root
+        self.spool_dir = spool_dir
+        self.branch = branch
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.api_url = api_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Accept": "application/vnd.github+json",
+        })
+        self._seq = itertools.count()
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    def pending(self):
+        return sorted(f for f in os.listdir(self.spool_dir) if f.endswith(".ndjson.gz"))
+
+    def add(self, payload, now=None):
+        """
+        Spool one run payload and flush once `batch_size` runs are pending.
+        """
+        now = now or datetime.now(timezone(timedelta(hours=8)))
+        # 同一秒内多次 add（或多个进程共用 spool）不能互相覆盖
+        name = f"{now.strftime('%Y-%m-%d-%H%M%S')}-{os.getpid()}-{next(self._seq):06d}.ndjson.gz"
+        tmp = os.path.join(self.spool_dir, name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(to_ndjson_gz(payload))
+        os.replace(tmp, os.path.join(self.spool_dir, name))
+
+        if len(self.pending()) >= self.batch_size:
+            return self.flush()
+        return False
+
+    def _repo_path(self, name):
+        # reddit/sentiment/2026/02/05/2026-02-05-012338-4242-000000.ndjson.gz
+        y, m, d = name[:10].split("-")
+        return f"{self.output_root}/{y}/{m}/{d}/{name}"
+
+    def _request(self, method, path, **kwargs):
+        url = f"{self.api_url}/repos/{self.repo}{path}"
+        resp = self.session.request(method, url, timeout=30, **kwargs)
+        if resp.status_code in RETRY_STATUSES or (
+            resp.status_code == 403 and (
+                "rate limit" in resp.text.lower() or resp.headers.get("Retry-After")
+            )
+        ):
+            raise RetryableError(f"{method} {path}: {resp.status_code}", resp.headers.get("Retry-After"))
+        resp.raise_for_status()
+        return resp.json()
+
+    def _commit(self, files):
+        ref = self._request("GET", f"/git/ref/heads/{self.branch}")
+        parent = ref["object"]["sha"]
+        base_tree = self._request("GET", f"/git/commits/{parent}")["tree"]["sha"]
+
+        tree = []
+        for name in files:
+            with open(os.path.join(self.spool_dir, name), "rb") as f:
+                content = base64.b64encode(f.read()).decode("ascii")
+            blob = self._request("POST", "/git/blobs", json={"content": content, "encoding": "base64"})
+            tree.append({"path": self._repo_path(name), "mode": "100644", "type": "blob", "sha": blob["sha"]})
+
+        new_tree = self._request("POST", "/git/trees", json={"base_tree": base_tree, "tree": tree})
+        now = datetime.now(timezone(timedelta(hours=8)))
+        commit = self._request("POST", "/git/commits", json={
+            "message": f"🤖 Reddit Incremental: {now.strftime('%H:%M:%S')} ({len(files)} runs)",
+            "tree": new_tree["sha"],
+            "parents": [parent],
+        })
+        # 非 fast-forward 会返回 422，整体重试即可
+        self._request("PATCH", f"/git/refs/heads/{self.branch}", json={"sha": commit["sha"]})
+
+    def flush(self):
+        files = self.pending()
+        if not files:
+            return True
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with stage("github_sync", items=len(files)) as span:
+                    span.bytes = sum(os.path.getsize(os.path.join(self.spool_dir, f)) for f in files)
+                    self._commit(files)
+                for name in files:
+                    os.remove(os.path.join(self.spool_dir, name))
+                logger.info(f"✅ Synced {len(files)} file(s) in one commit")
+                return True
+            except (RetryableError, requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    logger.error(f"❌ Sync gave up after {attempt + 1} attempts: {e}; {len(files)} file(s) kept in {self.spool_dir}")
+                    return False
+                retry_after = getattr(e, "retry_after", None)
+                delay = float(retry_after) if retry_after else self.base_delay * 2 ** attempt
+                delay += random.uniform(0, self.base_delay)
+                logger.warning(f"⚠️ Sync attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+            except Exception as e:
+                logger.error(f"❌ Sync failed: {e}; {len(files)} file(s) kept in {self.spool_dir}")
+                return False
@@ -0,0 +1,166 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from .logger_config import setup_logger
+
+logger = setup_logger()
+
+# PROFILE=cprofile|sample 只对本进程的下一次运行生效
+PROFILE_MODE = os.environ.get("PROFILE", "").lower()
+PROFILE_OUTPUT = os.environ.get("PROFILE_OUTPUT", "run.prof")
+SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.01"))
+
+_lock = threading.Lock()
+_stages = {}
+_started = time.time()
+_profiled = False
+
+
+class Span:
+    """
+    Handle yielded by `stage()`; bump `items` and `bytes` while the block runs.
+    """
+    def __init__(self):
+        self.items = 0
+        self.bytes = 0
+
+
+def reset():
+    global _started
+    with _lock:
+        _stages.clear()
+        _started = time.time()
+
+
+def _record(name, wall, cpu, items, nbytes):
+    with _lock:
+        s = _stages.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "items": 0, "bytes": 0})
+        s["calls"] += 1
+        s["wall_s"] += wall
+        s["cpu_s"] += cpu
+        s["items"] += items
+        s["bytes"] += nbytes
+
+
+@contextmanager
+def stage(name, items=0, nbytes=0):
+    """
+    Time a block: wall time, CPU time of the current thread, item and byte counts.
+    """
+    span = Span()
+    span.items, span.bytes = items, nbytes
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield span
+    finally:
+        _record(name, time.perf_counter() - wall, time.thread_time() - cpu, span.items, span.bytes)
+
+
+def timed(name, items=1):
+    """
+    Decorator form of `stage()`; every call counts as `items` items.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name, items=items):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def run_report():
+    with _lock:
+        stages = {
+            name: {**s, "wall_s": round(s["wall_s"], 4), "cpu_s": round(s["cpu_s"], 4)}
+            for name, s in sorted(_stages.items())
+        }
+    return {
+        "started": _started,
+        "elapsed_s": round(time.time() - _started, 4),
+        "stages": stages,
+    }
+
+
+def write_run_report(path):
+    report = run_report()
+    with open(path, "w") as f:
+        json.dump(report, f, separators=(",", ":"))
+    logger.info(f"📊 Run report: {json.dumps(report['stages'], ensure_ascii=False)}")
+    return report
+
+
+class _Sampler:
+    """
+    Samples the stacks of all threads every `interval` seconds and writes them
+    in collapsed-stack format (one `a;b;c count` per line) for flame graphs.
+    cProfile only sees the calling thread, this also covers pipeline workers.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, path):
+        self._stop.set()
+        self._thread.join()
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile_run():
+    """
+    Profile one run when PROFILE is set: `cprofile` dumps pstats data to
+    PROFILE_OUTPUT, `sample` writes collapsed stacks there instead.
+    """
+    global _profiled
+    if _profiled or PROFILE_MODE not in ("cprofile", "sample"):
+        yield
+        return
+    _profiled = True
+
+    if PROFILE_MODE == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(PROFILE_OUTPUT)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+            logger.info(f"🔬 cProfile output written to {PROFILE_OUTPUT}")
+    else:
+        sampler = _Sampler(SAMPLE_INTERVAL)
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop(PROFILE_OUTPUT)
+            logger.info(f"🔬 Sampled stacks written to {PROFILE_OUTPUT}")
@@ -1,41 +1,234 @@
+import queue
+import threading
+import time
 from textblob import TextBlob
-from .get_reddit_data import get_post_data
+from .get_reddit_data import iter_post_pages
+from .instrumentation import timed
 from .logger_config import setup_logger
 from datetime import datetime
 
 logger = setup_logger()
 
+# 队列里的结束标记
+_DONE = object()
+
 def analyze_sentiment(text):
     try:
         return TextBlob(str(text)).sentiment.polarity
     except:
         return 0.0
 
+def rank_score(post):
+    vibe = float(post.get('vibe_val', 0))
+    score = int(post.get('score', 0))
+    return score * (abs(vibe) + 0.1)
+
+
+class Stage:
+    """
+    One step of a StagedPipeline.
+
+    `fn` takes an item and returns the transformed item, or None to drop it.
+    With `fan_out=True` it returns an iterable and every element is passed on.
+    """
+    def __init__(self, name, fn, workers=1, fan_out=False):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.fan_out = fan_out
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def _record(self, items_in=0, items_out=0, errors=0, busy=0.0):
+        with self._lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.errors += errors
+            self.busy_seconds += busy
+
+    def stats(self, elapsed):
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "items_per_second": round(self.items_out / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+class StagedPipeline:
+    """
+    Runs a chain of Stages, each on its own worker threads, connected by
+    bounded queues. A full queue blocks the upstream stage (backpressure), so
+    fetching the next page overlaps with scoring the current one without
+    buffering the whole listing.
+    """
+    def __init__(self, stages, queue_size=32):
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _feed(self, source, q_out, next_workers):
+        try:
+            for item in source:
+                if not self._put(q_out, item):
+                    return
+        except Exception as e:
+            logger.error(f"Pipeline source failed: {e}")
+        for _ in range(next_workers):
+            self._put(q_out, _DONE)
+
+    def _work(self, stage, q_in, q_out, next_workers):
+        while True:
+            item = self._get(q_in)
+            if item is _DONE:
+                break
+            stage._record(items_in=1)
+            started = time.perf_counter()
+            try:
+                result = stage.fn(item)
+                outputs = result if stage.fan_out else (result,)
+                # fan-out 的结果边产生边下发，不等整页列表
+                for out in outputs:
+                    if out is None:
+                        continue
+                    stage._record(items_out=1, busy=time.perf_counter() - started)
+                    if not self._put(q_out, out):
+                        return
+                    started = time.perf_counter()
+                stage._record(busy=time.perf_counter() - started)
+            except Exception as e:
+                stage._record(errors=1, busy=time.perf_counter() - started)
+                logger.warning(f"Stage '{stage.name}' failed on item: {e}")
+
+        # 最后一个退出的 worker 负责通知下游
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last:
+            for _ in range(next_workers):
+                self._put(q_out, _DONE)
+
+    def run(self, source):
+        """
+        Feed `source` through all stages and yield what the last stage emits.
+        """
+        self._stop.clear()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        next_workers = [s.workers for s in self.stages[1:]] + [1]
+
+        threads = [threading.Thread(
+            target=self._feed, args=(source, queues[0], self.stages[0].workers), daemon=True
+        )]
+        for i, stage in enumerate(self.stages):
+            stage._running = stage.workers
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], queues[i + 1], next_workers[i]),
+                    name=f"stage-{stage.name}",
+                    daemon=True,
+                ))
+
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join(timeout=1)
+            self.elapsed = time.perf_counter() - started
+            for s in self.stats():
+                logger.debug(f"📈 {s}")
+
+    def stats(self):
+        return [s.stats(self.elapsed) for s in self.stages]
+
+
+@timed("pipeline.clean")
+def _clean_post(post):
+    # 构造完整文本
+    post['clean_text'] = f"{post.get('title', '')} {post.get('selftext', '')}"
+    try:
+        post['timestamp'] = datetime.utcfromtimestamp(post.get('created_utc', 0))
+    except:
+        post['timestamp'] = datetime.utcnow()
+    return post
+
+@timed("pipeline.score")
+def _score_post(post):
+    post['vibe_val'] = analyze_sentiment(post['clean_text'])
+    return post
+
+@timed("pipeline.rank")
+def _rank_post(post):
+    post['rank_score'] = rank_score(post)
+    return post
+
+def build_subreddit_pipeline(post_limit, posts_to_get="Hot", sink=None,
+                             fetch_workers=1, score_workers=1, queue_size=32):
+    """
+    Build the fetch -> clean -> score -> rank -> sink pipeline. The source fed
+    to `run()` is an iterable of subreddit names.
+
+    `sink` is called with every ranked post; the pipeline yields the posts
+    either way.
+    """
+    def fetch(subreddit_name):
+        logger.info(f"🚀 Fetching r/{subreddit_name}...")
+        for page in iter_post_pages(subreddit_name, post_limit, posts_to_get):
+            yield from page
+
+    def emit(post):
+        if sink is not None:
+            sink(post)
+        return post
+
+    return StagedPipeline([
+        Stage("fetch", fetch, workers=fetch_workers, fan_out=True),
+        Stage("clean", _clean_post),
+        Stage("score", _score_post, workers=score_workers),
+        Stage("rank", _rank_post),
+        Stage("sink", emit),
+    ], queue_size=queue_size)
+
 def top_posts_subreddit_pipeline(subreddit_name, post_limit, comment_limmit, posts_to_get="Hot"):
-    # 1. 获取数据
-    posts = get_post_data(subreddit_name, post_limit, comment_limmit, None, posts_to_get)
-    
-    if not posts:
+    # 单 worker 的各阶段保持原有顺序
+    pipeline = build_subreddit_pipeline(post_limit, posts_to_get)
+    processed_posts = list(pipeline.run([subreddit_name]))
+
+    if not processed_posts:
         logger.warning(f"No posts found for r/{subreddit_name}")
-        return [] 
-        
-    # 2. 轻量级情感分析
-    processed_posts = []
-    for post in posts:
-        # 构造完整文本
-        full_text = f"{post.get('title', '')} {post.get('selftext', '')}"
-        
-        # 情感打分
-        score = analyze_sentiment(full_text)
-        
-        # 写入新字段
-        post['vibe_val'] = score
-        post['clean_text'] = full_text
-        try:
-            post['timestamp'] = datetime.utcfromtimestamp(post.get('created_utc', 0))
-        except:
-            post['timestamp'] = datetime.utcnow()
-        
-        processed_posts.append(post)
+        return []
 
     return processed_posts
@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+import time
+
+from .logger_config import setup_logger
+
+logger = setup_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subreddit_stats (
+    subreddit TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    mean REAL NOT NULL,
+    ewma REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS champions (
+    subreddit TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    rank_score REAL NOT NULL,
+    title TEXT,
+    url TEXT,
+    score INTEGER,
+    vibe REAL,
+    summary TEXT,
+    PRIMARY KEY (subreddit, post_id)
+);
+CREATE INDEX IF NOT EXISTS champions_rank ON champions (subreddit, rank_score DESC);
+CREATE TABLE IF NOT EXISTS seen_posts (
+    subreddit TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (subreddit, post_id)
+);
+"""
+
+
+class SentimentStateStore:
+    """
+    Per-subreddit rolling aggregates kept across runs in SQLite.
+
+    Each new post updates the count, running mean and EWMA of `vibe_val` in
+    O(1), and the champions table is trimmed to the top `top_k` posts by
+    `rank_score`. Posts already counted (hot listings repeat between runs)
+    only refresh their champion entry.
+    """
+    def __init__(self, path="sentiment_state.db", alpha=0.1, top_k=5, seen_ttl_days=7):
+        self.alpha = alpha
+        self.top_k = top_k
+        self.seen_ttl = seen_ttl_days * 86400
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def update(self, subreddit, posts):
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute(
+                "SELECT count, mean, ewma FROM subreddit_stats WHERE subreddit = ?", (subreddit,)
+            ).fetchone()
+            count, mean, ewma = row if row else (0, 0.0, None)
+
+            for p in posts:
+                post_id = p.get('id')
+                vibe = float(p.get('vibe_val', 0))
+                is_new = self.conn.execute(
+                    "INSERT OR IGNORE INTO seen_posts VALUES (?, ?, ?)", (subreddit, post_id, now)
+                ).rowcount == 1
+                if is_new:
+                    count += 1
+                    mean += (vibe - mean) / count
+                    ewma = vibe if ewma is None else self.alpha * vibe + (1 - self.alpha) * ewma
+
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO champions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (subreddit, post_id, float(p.get('rank_score', 0)), p.get('title'), p.get('url'),
+                     p.get('score'), vibe, p.get('clean_text', '')[:100]),
+                )
+
+            if count:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO subreddit_stats VALUES (?, ?, ?, ?, ?)",
+                    (subreddit, count, mean, ewma, now),
+                )
+            # 只保留 top-K
+            self.conn.execute(
+                """DELETE FROM champions WHERE subreddit = ? AND post_id NOT IN (
+                       SELECT post_id FROM champions WHERE subreddit = ?
+                       ORDER BY rank_score DESC LIMIT ?)""",
+                (subreddit, subreddit, self.top_k),
+            )
+            self.conn.execute("DELETE FROM seen_posts WHERE seen_at < ?", (now - self.seen_ttl,))
+
+    def summary(self, subreddit):
+        """
+        Rolling stats and champions for one subreddit, read straight from the
+        stored aggregates.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT count, mean, ewma FROM subreddit_stats WHERE subreddit = ?", (subreddit,)
+            ).fetchone()
+            champions = self.conn.execute(
+                """SELECT title, url, score, vibe, summary FROM champions
+                   WHERE subreddit = ? ORDER BY rank_score DESC""",
+                (subreddit,),
+            ).fetchall()
+        count, mean, ewma = row if row else (0, 0.0, 0.0)
+        return {
+            "subreddit": subreddit,
+            "post_count": count,
+            "rolling_avg_sentiment": mean,
+            "ewma_sentiment": ewma,
+            "champions": [
+                {"title": t, "url": u, "score": s, "vibe": v, "summary": m}
+                for t, u, s, v, m in champions
+            ],
+        }
+
+    def close(self):
+        self.conn.close()
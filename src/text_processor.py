@@ -8,6 +8,7 @@ from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 import spacy
 
+from .instrumentation import timed
 from .logger_config import setup_logger
 
 nltk.download("averaged_perceptron_tagger")
@@ -114,6 +115,7 @@ def lemmatize_text_spacy(text):
     return lemmatized_output
 
 
+@timed("clean_text")
 def clean_text(text):
     """
     Apply all cleaning functions to text
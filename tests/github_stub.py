@@ -0,0 +1,97 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class GitHubStub:
+    """
+    Minimal stand-in for the Git Data API endpoints GitHubBatchSink uses:
+    GET ref / commit, POST blobs / trees / commits, PATCH ref.
+
+    `failures` maps "METHOD /suffix" (e.g. "POST /git/blobs") to a list of
+    (status, body, headers) responses returned before the call succeeds.
+    """
+    def __init__(self, branch="main", head_sha="c0", tree_sha="t0"):
+        self.branch = branch
+        self.head_sha = head_sha
+        self.tree_sha = tree_sha
+        self.calls = []
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.failures = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail(self, call, status, body=None, headers=None, times=1):
+        self.failures.setdefault(call, []).extend([(status, body or {"message": "stub failure"}, headers or {})] * times)
+
+    def _route(self, method, path, body):
+        with self._lock:
+            self.calls.append((method, path))
+            for call, queued in self.failures.items():
+                fail_method, suffix = call.split(" ", 1)
+                if method == fail_method and path.endswith(suffix) and queued:
+                    return queued.pop(0)
+
+            n = len(self.calls)
+            if method == "GET" and "/git/ref/heads/" in path:
+                return 200, {"object": {"sha": self.head_sha}}, {}
+            if method == "GET" and "/git/commits/" in path:
+                return 200, {"tree": {"sha": self.tree_sha}}, {}
+            if method == "POST" and path.endswith("/git/blobs"):
+                sha = f"b{n}"
+                self.blobs[sha] = base64.b64decode(body["content"])
+                return 201, {"sha": sha}, {}
+            if method == "POST" and path.endswith("/git/trees"):
+                sha = f"t{n}"
+                self.trees[sha] = body
+                return 201, {"sha": sha}, {}
+            if method == "POST" and path.endswith("/git/commits"):
+                sha = f"c{n}"
+                self.commits[sha] = body
+                return 201, {"sha": sha}, {}
+            if method == "PATCH" and path.endswith(f"/git/refs/heads/{self.branch}"):
+                if body["sha"] not in self.commits:
+                    return 422, {"message": "unknown commit"}, {}
+                self.head_sha = body["sha"]
+                return 200, {"object": {"sha": self.head_sha}}, {}
+            return 404, {"message": "Not Found"}, {}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                status, payload, headers = stub._route(self.command, self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = _dispatch
+
+        return Handler
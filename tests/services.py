@@ -0,0 +1,20 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_service(directory):
+    """
+    Import `<directory>/main.py` as `<directory>_main`. Every service's entry
+    point is called main.py and the directories are not packages, so they
+    can't be imported by name side by side.
+    """
+    name = directory.replace("-", "_") + "_main"
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, ROOT / directory / "main.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
@@ -0,0 +1,88 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+from github_stub import GitHubStub
+from src.github_sink import GitHubBatchSink
+
+NOW = datetime(2026, 2, 5, 1, 23, 38)
+
+
+@pytest.fixture
+def stub():
+    with GitHubStub() as stub:
+        yield stub
+
+
+def make_sink(stub, tmp_path, **kwargs):
+    kwargs.setdefault("batch_size", 2)
+    return GitHubBatchSink("owner/repo", "token", "reddit/sentiment", spool_dir=str(tmp_path / "spool"),
+                           base_delay=0.01, api_url=stub.url, **kwargs)
+
+
+def payload(subreddit):
+    return {"timestamp": "T", "data": [{"subreddit": subreddit, "avg_sentiment": 0.5}]}
+
+
+def test_batch_commits_blobs_tree_commit_ref(stub, tmp_path):
+    sink = make_sink(stub, tmp_path)
+
+    assert sink.add(payload("a"), now=NOW) is False
+    assert sink.add(payload("b"), now=NOW) is True
+
+    assert [method for method, _ in stub.calls] == ["GET", "GET", "POST", "POST", "POST", "POST", "PATCH"]
+    assert [path.rsplit("/", 1)[-1] for _, path in stub.calls[2:6]] == ["blobs", "blobs", "trees", "commits"]
+
+    tree = next(iter(stub.trees.values()))
+    assert tree["base_tree"] == "t0"
+    paths = [entry["path"] for entry in tree["tree"]]
+    assert len(paths) == 2 and all(p.startswith("reddit/sentiment/2026/02/05/2026-02-05-012338-") for p in paths)
+    records = [json.loads(gzip.decompress(blob)) for blob in stub.blobs.values()]
+    assert sorted(r["subreddit"] for r in records) == ["a", "b"]
+
+    commit_sha, commit = next(iter(stub.commits.items()))
+    assert commit["parents"] == ["c0"]
+    assert stub.head_sha == commit_sha
+    assert sink.pending() == []
+
+
+def test_retries_transient_errors_then_succeeds(stub, tmp_path):
+    stub.fail("POST /git/blobs", 502)
+    stub.fail("POST /git/blobs", 403, {"message": "You have exceeded a secondary rate limit"}, {"Retry-After": "0"})
+    stub.fail("PATCH /git/refs/heads/main", 409, {"message": "Reference update failed"})
+    sink = make_sink(stub, tmp_path, max_retries=5)
+
+    sink.add(payload("a"), now=NOW)
+    assert sink.add(payload("b"), now=NOW) is True
+
+    assert [method for method, path in stub.calls].count("PATCH") == 2
+    assert stub.head_sha in stub.commits
+    assert sink.pending() == []
+
+
+def test_gives_up_and_keeps_spool(stub, tmp_path):
+    stub.fail("POST /git/blobs", 503, times=10)
+    sink = make_sink(stub, tmp_path, max_retries=2)
+
+    sink.add(payload("a"), now=NOW)
+    assert sink.add(payload("b"), now=NOW) is False
+
+    assert sum(path.endswith("/git/blobs") for _, path in stub.calls) == 3
+    assert stub.head_sha == "c0"
+    assert len(sink.pending()) == 2
+
+    # 下一次 flush 把留下的文件补传上去
+    stub.failures.clear()
+    assert sink.flush() is True
+    assert sink.pending() == []
+
+
+def test_same_second_payloads_do_not_overwrite(stub, tmp_path):
+    sink = make_sink(stub, tmp_path, batch_size=10)
+
+    sink.add(payload("a"), now=NOW)
+    sink.add(payload("b"), now=NOW)
+
+    assert len(sink.pending()) == 2
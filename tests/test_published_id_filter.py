@@ -0,0 +1,65 @@
+from services import load_service
+
+producer = load_service("reddit-producer")
+
+
+def read_ids(path):
+    return path.read_text().split()
+
+
+def test_only_confirmed_ids_are_snapshotted(tmp_path):
+    path = tmp_path / "published_ids.txt"
+    ids = producer.PublishedIdFilter(str(path))
+
+    assert ids.seen("a") is False
+    assert ids.seen("b") is False
+    # 还没确认的也算见过，重新抓到时不会重复发
+    assert ids.seen("a") is True
+    ids.confirm("a")
+    ids.snapshot()
+
+    assert read_ids(path) == ["a"]
+    assert ids.suppressed == 1
+
+
+def test_snapshot_merges_with_other_producers(tmp_path):
+    path = tmp_path / "published_ids.txt"
+    first = producer.PublishedIdFilter(str(path))
+    second = producer.PublishedIdFilter(str(path))
+
+    first.seen("a")
+    first.confirm("a")
+    first.snapshot()
+    second.seen("b")
+    second.confirm("b")
+    second.snapshot()
+
+    assert read_ids(path) == ["a", "b"]
+    assert producer.PublishedIdFilter(str(path)).seen("a") is True
+
+
+def test_snapshot_keeps_the_most_recent_ids_within_capacity(tmp_path):
+    path = tmp_path / "published_ids.txt"
+    path.write_text("old1\nold2\nold3\n")
+    ids = producer.PublishedIdFilter(str(path), capacity=3)
+
+    for post_id in ("new1", "new2"):
+        ids.seen(post_id)
+        ids.confirm(post_id)
+    ids.snapshot()
+
+    assert read_ids(path) == ["old3", "new1", "new2"]
+
+
+def test_snapshots_every_n_confirms(tmp_path):
+    path = tmp_path / "published_ids.txt"
+    ids = producer.PublishedIdFilter(str(path), snapshot_every=2)
+
+    for post_id in ("a", "b"):
+        ids.seen(post_id)
+        ids.confirm(post_id)
+    assert not path.exists()
+
+    # 落盘在生产者线程的下一次 seen() 里做
+    ids.seen("c")
+    assert read_ids(path) == ["a", "b"]
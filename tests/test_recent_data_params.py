@@ -0,0 +1,49 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from services import load_service
+
+api = load_service("api")
+
+
+def test_cursor_round_trip_continues_after_the_last_post():
+    post_id = ObjectId()
+    cursor = api.encode_cursor({"_id": post_id, "now_time": 1770254618.5})
+
+    # URL 里直接用，不带 padding
+    assert "=" not in cursor
+    assert api.decode_cursor(cursor) == {"$or": [
+        {"now_time": {"$lt": 1770254618.5}},
+        {"now_time": 1770254618.5, "_id": {"$lt": post_id}},
+    ]}
+
+
+def test_cursor_keeps_non_objectid_ids():
+    query = api.decode_cursor(api.encode_cursor({"_id": "imported-1", "now_time": 10}))
+
+    assert query["$or"][1] == {"now_time": 10.0, "_id": {"$lt": "imported-1"}}
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "e30", api.encode_cursor({"_id": "x", "now_time": "soon"})])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        api.decode_cursor(cursor)
+
+    assert exc.value.status_code == 400
+
+
+def test_fields_default_to_every_post_field():
+    assert api.parse_fields(None) == {name: 1 for name in api.POST_FIELDS}
+
+
+def test_fields_always_include_the_cursor_keys():
+    assert api.parse_fields(" title, subreddit ,") == {"_id": 1, "now_time": 1, "title": 1, "subreddit": 1}
+
+
+def test_unknown_fields_are_a_400():
+    with pytest.raises(HTTPException) as exc:
+        api.parse_fields("title,password,secret")
+
+    assert exc.value.status_code == 400
+    assert exc.value.detail == "Unknown fields: password, secret"
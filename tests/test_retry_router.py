@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pika
+import pytest
+
+from services import load_service
+
+consumer = load_service("reddit-consumer")
+
+
+class FakeChannel:
+    def __init__(self):
+        self.declared = {}
+        self.published = []
+
+    def queue_declare(self, queue, durable, arguments=None):
+        self.declared[queue] = arguments
+
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append((routing_key, body, properties))
+
+
+@pytest.fixture
+def router():
+    return consumer.RetryRouter("python", max_attempts=4, base_delay_ms=100, levels=2)
+
+
+def properties(headers=None):
+    return pika.BasicProperties(content_type="application/msgpack", content_encoding="zstd", headers=headers)
+
+
+def test_declares_delay_queues_that_dead_letter_back(router):
+    channel = FakeChannel()
+    router.declare(channel)
+
+    back = {"x-dead-letter-exchange": "", "x-dead-letter-routing-key": "python"}
+    assert channel.declared == {
+        "python.dlq": None,
+        "python.retry.0": {"x-message-ttl": 100, **back},
+        "python.retry.1": {"x-message-ttl": 200, **back},
+    }
+
+
+def test_counts_attempts_until_the_dlq(router):
+    channel = FakeChannel()
+    props = properties()
+
+    destinations = []
+    for _ in range(4):
+        # 每次都是从延迟队列回到主队列后再次失败
+        method = SimpleNamespace(routing_key="python")
+        destinations.append(router.reject(channel, method, props, b"body", RuntimeError("boom"), retryable=True))
+        _, body, props = channel.published[-1]
+        assert body == b"body"
+
+    # 超过最后一级后一直用最长的延迟队列
+    assert destinations == ["python.retry.0", "python.retry.1", "python.retry.1", "python.dlq"]
+    assert props.headers["x-attempt"] == 4
+    assert props.headers["x-last-error"] == "RuntimeError('boom')"
+    assert props.headers["x-original-routing-key"] == "python"
+    assert (props.delivery_mode, props.content_type, props.content_encoding) == (2, "application/msgpack", "zstd")
+
+
+def test_non_retryable_errors_go_straight_to_the_dlq(router):
+    error = consumer.UnsupportedSchemaVersion("unsupported x-schema-version 2")
+
+    destination, headers = router.route({"x-schema-version": 2}, "python", error, retryable=False)
+
+    assert destination == "python.dlq"
+    assert headers["x-attempt"] == 1
+    assert headers["x-schema-version"] == 2
+
+
+def test_keeps_the_original_routing_key_and_truncates_errors(router):
+    destination, headers = router.route({"x-attempt": 1, "x-original-routing-key": "datascience"}, "python",
+                                        ValueError("x" * 1000), retryable=True)
+
+    assert destination == "python.retry.1"
+    assert headers["x-original-routing-key"] == "datascience"
+    assert len(headers["x-last-error"]) == 500